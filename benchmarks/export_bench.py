@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from openpyxl.styles import PatternFill, Font, Border, Side
+
+from export import SheetSpec, export_workbook
+from loader import load_call_log
+from metrics import CALL_LOG_PATH
+
+
+def call_log_chunks(rows):
+    sample = load_call_log(CALL_LOG_PATH)
+    produced = 0
+    while produced < rows:
+        chunk = sample.iloc[:rows - produced]
+        produced += len(chunk)
+        yield chunk
+
+
+def legacy_export(frame, target):
+    # The per-cell approach dms.py used before export.py
+    with pd.ExcelWriter(target, engine='openpyxl') as writer:
+        frame.to_excel(writer, index=False, sheet_name='Lead Data')
+        worksheet = writer.sheets['Lead Data']
+        yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+        for cell in worksheet[1]:
+            cell.fill = yellow_fill
+        thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+        for row in worksheet.iter_rows(min_row=1, max_row=worksheet.max_row, min_col=1, max_col=worksheet.max_column):
+            for cell in row:
+                cell.border = thin_border
+        for cell in worksheet[worksheet.max_row]:
+            cell.font = Font(bold=True)
+
+
+def streaming_export(chunks, columns, target):
+    export_workbook([SheetSpec('Lead Data', columns, chunks, total_label='Total')], target)
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_once(mode, rows):
+    columns = list(load_call_log(CALL_LOG_PATH).columns)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        target = os.path.join(tmp_dir, 'export.xlsx')
+        start = time.perf_counter()
+        if mode == 'legacy':
+            legacy_export(pd.concat(call_log_chunks(rows), ignore_index=True), target)
+        else:
+            streaming_export(call_log_chunks(rows), columns, target)
+        elapsed = time.perf_counter() - start
+    return {'mode': mode, 'rows': rows, 'seconds': round(elapsed, 3),
+            'rows_per_sec': round(rows / elapsed), 'peak_rss_mb': round(peak_rss_mb(), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the legacy and streaming Excel exports.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--modes', nargs='+', default=['legacy', 'streaming'], choices=['legacy', 'streaming'])
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_once(args.modes[0], args.rows[0])))
+        return
+
+    # Each run gets its own process so peak RSS is not shared between modes
+    for rows in args.rows:
+        for mode in args.modes:
+            output = subprocess.run(
+                [sys.executable, __file__, '--child', '--modes', mode, '--rows', str(rows)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output)
+            print(f"{result['mode']:>9} {result['rows']:>9} rows  {result['seconds']:>8.2f}s  "
+                  f"{result['rows_per_sec']:>8} rows/s  {result['peak_rss_mb']:>8.1f} MB peak RSS")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import figures
+from cohort import COHORT_COLUMNS, build_cohort_index, cohort_matrix
+from cube import CUBE_COLUMNS, DIMENSIONS, Cube
+from export import call_log_sheet, export_workbook, funnel_sheet, ratio_sheet
+from latency import LATENCY_COLUMNS, compute_latency
+from loader import build_cache, call_log_columns, iter_call_log, load_call_log, map_call_log, publish_shared, read_call_log_csv
+from metrics import METRIC_COLUMNS, compute_funnel, compute_monthly_metrics, funnel_frame, load_monthly_inputs
+from streaming import streaming_funnel
+from timeseries import SERIES, TIMESERIES_COLUMNS, CallTimeSeries
+from synthetic import _rows_arg, generate_call_log
+
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+DATA_DIR = os.path.join(BENCH_DIR, 'data')
+
+# Differences below these are noise, whatever the relative change
+MIN_SECONDS_DELTA = 0.05
+MIN_PEAK_MB_DELTA = 1.0
+
+
+def _limited_chunks(chunks, rows):
+    for chunk in chunks:
+        if rows <= 0:
+            return
+        yield chunk.iloc[:rows]
+        rows -= len(chunk)
+
+
+def build_stages(path, cache_dir, export_rows):
+    state = {}
+
+    def csv_load():
+        state['raw'] = read_call_log_csv(path)
+        return len(state.pop('raw'))
+
+    def cache_build():
+        build_cache(path, cache_dir)
+
+    def cache_load():
+        state['data'] = load_call_log(path, columns=METRIC_COLUMNS, cache_dir=cache_dir)
+        return len(state['data'])
+
+    def shared_publish():
+        publish_shared(path, cache_dir)
+
+    def shared_map():
+        # What each Dash worker pays to get the frame from the mapped Arrow file
+        return len(map_call_log(path, columns=METRIC_COLUMNS, cache_dir=cache_dir)[1])
+
+    def funnel():
+        state['funnel_vals'] = compute_funnel(state['data'])
+
+    def funnel_streaming():
+        streaming_funnel(path, source='csv')
+
+    def monthly():
+        state['rd_1'] = compute_monthly_metrics(state['data'], load_monthly_inputs())
+
+    def latency():
+        state['latency'] = compute_latency(load_call_log(path, columns=LATENCY_COLUMNS, cache_dir=cache_dir))
+
+    def latency_figures():
+        return len(figures.latency_figures(state['latency']))
+
+    def cohort():
+        state['cohort'] = cohort_matrix(*build_cohort_index(load_call_log(path, columns=COHORT_COLUMNS, cache_dir=cache_dir)))
+
+    def cohort_figure():
+        figures.cohort_heatmap_figure(state['cohort'])
+
+    def timeseries():
+        state['timeseries'] = CallTimeSeries(load_call_log(path, columns=TIMESERIES_COLUMNS, cache_dir=cache_dir))
+
+    def timeseries_figures():
+        return [figures.timeseries_figure(series, *state['timeseries'].query(series, granularity='call')) for series in SERIES]
+
+    def cube():
+        state['cube'] = Cube.build(load_call_log(path, columns=CUBE_COLUMNS, cache_dir=cache_dir), load_monthly_inputs())
+
+    def cube_drill():
+        cube = state['cube']
+        return [cube.drill(dimension, month=month) for month in cube.members('month') for dimension in DIMENSIONS[1:]]
+
+    def dash_figures():
+        return len(figures.dash_figures(state['funnel_vals'], state['rd_1']))
+
+    def streamlit_figures():
+        return len(figures.streamlit_figures(state['funnel_vals'], state['rd_1']))
+
+    def excel_export():
+        chunks = _limited_chunks(iter_call_log(path, cache_dir=cache_dir), export_rows)
+        export_workbook([
+            ratio_sheet(state['rd_1']),
+            funnel_sheet(funnel_frame(state['funnel_vals'])),
+            call_log_sheet(call_log_columns(path, cache_dir), chunks),
+        ], os.path.join(cache_dir, 'export.xlsx'))
+
+    return [csv_load, cache_build, cache_load, shared_publish, shared_map, funnel, funnel_streaming, monthly, latency, latency_figures, cohort, cohort_figure, timeseries, timeseries_figures, cube, cube_drill, dash_figures, streamlit_figures, excel_export]
+
+
+STAGE_NAMES = [stage.__name__ for stage in build_stages(None, None, 0)]
+
+
+def run_pass(path, export_rows, traced=False):
+    # Seconds per stage, or traced peak bytes; a fresh cache directory per
+    # pass, so every pass does the same work
+    results = {}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for stage in build_stages(path, cache_dir, export_rows):
+            if traced:
+                tracemalloc.start()
+                stage()
+                results[stage.__name__] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            else:
+                start = time.perf_counter()
+                stage()
+                results[stage.__name__] = time.perf_counter() - start
+    return results
+
+
+def run(rows, seed=0, export_rows=10_000, repeats=5):
+    path = os.path.join(DATA_DIR, f'calls_{rows}_seed{seed}.csv')
+    if not os.path.exists(path):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        generate_call_log(path, rows, seed)
+    # tracemalloc slows allocation-heavy stages several-fold, so wall times
+    # are the median of untraced passes and peaks come from a pass of their own
+    timings = [run_pass(path, export_rows) for _ in range(repeats)]
+    peaks = run_pass(path, export_rows, traced=True)
+    return {stage: {'seconds': round(statistics.median(timing[stage] for timing in timings), 4),
+                    'peak_mb': round(peaks[stage] / (1024 * 1024), 2)} for stage in STAGE_NAMES}
+
+
+def regressions(results, baseline, threshold):
+    failures = []
+    for stage, result in results.items():
+        base = baseline.get(stage)
+        if base is None:
+            continue
+        for metric, min_delta in [('seconds', MIN_SECONDS_DELTA), ('peak_mb', MIN_PEAK_MB_DELTA)]:
+            limit = base[metric] * (1 + threshold)
+            if result[metric] > limit and result[metric] - base[metric] > min_delta:
+                failures.append(f'{stage} {metric}: {result[metric]} > {base[metric]} (+{threshold:.0%})')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and memory-profile each dashboard pipeline stage on synthetic call logs.')
+    parser.add_argument('--rows', type=_rows_arg, nargs='+', default=[10_000], help='log sizes, e.g. 10k 1m 10m')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--export-rows', type=int, default=10_000, help='call-log rows written by the Excel export stage')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--repeats', type=int, default=5, help='untraced timing passes; each stage reports the median')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed relative regression per stage')
+    parser.add_argument('--stages', nargs='+', choices=STAGE_NAMES, default=STAGE_NAMES,
+                        help='stages to report, check and record; every stage still runs, as later ones need earlier results')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='record these results as the new baseline for the selected stages only')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    failures = []
+    for rows in args.rows:
+        results = run(rows, args.seed, args.export_rows, args.repeats)
+        results = {stage: results[stage] for stage in args.stages}
+        print(f'{rows} rows')
+        for stage, result in results.items():
+            print(f"  {stage:<18} {result['seconds']:>9.3f}s  {result['peak_mb']:>9.1f} MB peak")
+        if args.save_baseline:
+            baseline.setdefault(str(rows), {}).update(results)
+        else:
+            failures += [f'{rows} rows: {failure}' for failure in regressions(results, baseline.get(str(rows), {}), args.threshold)]
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2)
+        print(f'baseline written to {args.baseline}')
+    for failure in failures:
+        print(f'REGRESSION {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = [
+    'Phone Number', 'Created Date', 'Created Time Only', 'Start Date (Formatted)', 'Start Time',
+    'Response in Days', 'Response in Hours', 'Response in Minutes', 'Response in Sec', 'Duration',
+    'ConversationDuration', 'Price', 'Date', 'Time', 'Order id', 'Name_x', 'Lead Month', 'Location',
+    'Cluster name', 'Quantity', 'Aggregate', 'cost', 'Delivered', 'Feed back',
+    'Price Per Unit (IF TON/23.5)', 'Quantity (IF TON*23.5)',
+]
+
+# Rates observed in anew_2 (3).csv
+CALLS_PER_LEAD = 3.8
+UNCALLED_LEAD_RATE = 0.004
+CONNECTED_CALL_RATE = 0.37
+MISSING_PRICE_RATE = 0.023
+CONVERTED_LEAD_RATE = 0.006
+CLUSTER_RATE = 0.05
+
+LOCATIONS = ['Nizamabad', 'Feerzadiguda', 'Manchiral', 'Hyderabad', 'Shamshabad', 'Sathupally']
+AGGREGATES = ['20MM', '40MM', 'R-SAND']
+QUANTITIES = ['25.53 TON', '28.0 TON', '34.04 TON', '600.0 CFT', '100 CFT']
+FEEDBACK = ['Good', 'not answered', ' Quality issue']
+NAMES = ['Ramakrishna Chava', 'Santhosh Yadav', 'Srikanth Vemulavada', 'Salman Pasha', 'Suresh Sindham']
+
+CHUNK_LEADS = 200_000
+
+
+def _rows_arg(value):
+    value = value.lower().replace('_', '')
+    scale = {'k': 1_000, 'm': 1_000_000}.get(value[-1], 1)
+    return int(float(value.rstrip('km')) * scale)
+
+
+def _calls_for_leads(rng, leads):
+    # Geometric call counts with the observed mean; a few leads are never called
+    calls = rng.geometric(1 / CALLS_PER_LEAD, size=leads)
+    calls[rng.random(leads) < UNCALLED_LEAD_RATE] = 0
+    return calls
+
+
+def _generate_leads(rng, leads, start, end, phone_offset):
+    phones = phone_offset + np.arange(leads, dtype=np.int64)
+    span = int((end - start).total_seconds())
+    created = start + pd.to_timedelta(rng.integers(0, span, size=leads), unit='s')
+    return phones, created
+
+
+def generate_chunk(rng, leads, start, end, phone_offset, order_offset):
+    phones, created = _generate_leads(rng, leads, start, end, phone_offset)
+    calls = _calls_for_leads(rng, leads)
+    lead_index = np.repeat(np.arange(leads), np.maximum(calls, 1))
+    called = np.repeat(calls > 0, np.maximum(calls, 1))
+    rows = len(lead_index)
+
+    created_rows = created[lead_index]
+    response = np.round(rng.lognormal(np.log(225_000), 1.2, size=rows))
+    started = created_rows + pd.to_timedelta(response, unit='s')
+    duration = np.round(rng.lognormal(np.log(42), 0.7, size=rows))
+    connected = rng.random(rows) < CONNECTED_CALL_RATE
+    conversation = np.where(connected, np.maximum(duration - rng.integers(5, 30, size=rows), 1), 0)
+    price = 0.45 * np.maximum(1, np.ceil(duration / 30))
+    price[rng.random(rows) < MISSING_PRICE_RATE] = np.nan
+
+    frame = pd.DataFrame({
+        'Phone Number': phones[lead_index],
+        'Created Date': created_rows.strftime('%d/%m/%Y'),
+        'Created Time Only': created_rows.strftime('%H:%M:%S'),
+        'Start Date (Formatted)': started.strftime('%d/%m/%Y'),
+        'Start Time': started.strftime('%H:%M:%S'),
+        'Response in Days': response // 86400,
+        'Response in Hours': response // 3600,
+        'Response in Minutes': response // 60,
+        'Response in Sec': response,
+        'Duration': duration,
+        'ConversationDuration': conversation.astype(float),
+        'Price': price,
+    }, columns=COLUMNS)
+    call_columns = COLUMNS[3:12]
+    frame.loc[~called, call_columns] = np.nan
+
+    # Order columns are sparse: only converted leads carry them, on every call row
+    converted = rng.random(leads) < CONVERTED_LEAD_RATE
+    order_rows = converted[lead_index]
+    if order_rows.any():
+        # Order attributes are drawn per converted lead and repeated on its rows
+        order_leads = np.flatnonzero(converted)
+        order_of_row = np.searchsorted(order_leads, lead_index[order_rows])
+        count = len(order_leads)
+        ordered = created[order_leads] + pd.to_timedelta(rng.integers(1, 60, size=count), unit='D')
+        order_ids = order_offset + np.arange(count)
+        orders = pd.DataFrame({
+            'Date': ordered.strftime('%d/%m/%Y'),
+            'Order id': [f'TS18_{order_id}-2425-{order_id % 200}' for order_id in order_ids],
+            'Name_x': rng.choice(NAMES, size=count),
+            'Lead Month': created[order_leads].strftime('%y-%b'),
+            'Location': rng.choice(LOCATIONS, size=count),
+            'Cluster name': np.where(rng.random(count) < CLUSTER_RATE, 'Santhos', None),
+            'Quantity': rng.choice(QUANTITIES, size=count),
+            'Aggregate': rng.choice(AGGREGATES, size=count),
+            'cost': np.round(rng.uniform(3_000, 31_000, size=count), 2),
+            'Delivered': 'Y',
+            'Feed back': rng.choice(FEEDBACK, size=count),
+        })
+        frame.loc[order_rows, orders.columns] = orders.iloc[order_of_row].to_numpy()
+    return frame, int(converted.sum())
+
+
+def generate_call_log(path, rows, seed=0, start='2024-04-01', end='2024-10-01'):
+    rng = np.random.default_rng(seed)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    leads_needed = max(1, int(rows / CALLS_PER_LEAD))
+    written, phone_offset, order_offset = 0, 6_000_000_000, 0
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='') as target:
+        target.write(','.join(COLUMNS) + '\n')
+        while written < rows:
+            leads = min(CHUNK_LEADS, leads_needed)
+            frame, orders = generate_chunk(rng, leads, start, end, phone_offset, order_offset)
+            frame = frame.iloc[:rows - written]
+            frame.to_csv(target, header=False, index=False)
+            written += len(frame)
+            phone_offset += leads
+            order_offset += orders
+    os.replace(tmp_path, path)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic call log with the anew_2 (3).csv schema.')
+    parser.add_argument('rows', type=_rows_arg, help='row count, e.g. 10k, 1m or 10m')
+    parser.add_argument('--out', help='output CSV (default benchmarks/data/calls_<rows>.csv)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    out = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', f'calls_{args.rows}.csv')
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    print(generate_call_log(out, args.rows, args.seed))
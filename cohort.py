@@ -0,0 +1,117 @@
+import argparse
+import os
+import shutil
+
+import pandas as pd
+
+from instrument import timed
+from loader import CACHE_DIR, fingerprint, load_call_log
+from metrics import CALL_LOG_PATH, month_label, to_month
+
+COHORT_COLUMNS = [
+    'Phone Number', 'Created Date', 'Start Date (Formatted)', 'ConversationDuration',
+    'Delivered', 'Order id', 'Date', 'Aggregate', 'cost',
+]
+COHORT_VALUES = {
+    'orders': 'Orders delivered',
+    'converted_leads': 'Converted leads',
+    'revenue': 'Revenue',
+    'days_to_convert': 'Mean days to convert',
+}
+INDEX_FILES = ['phones', 'orders', 'matrix']
+
+
+@timed('cohort_index')
+def build_cohort_index(data):
+    connected = data['ConversationDuration'] > 0
+    calls = pd.DataFrame({
+        'phone': data['Phone Number'],
+        'first_lead': data['Created Date'],
+        'first_connected': data['Start Date (Formatted)'].where(connected),
+    })
+    phones = calls.groupby('phone').min().reset_index()
+    phones['lead_month'] = to_month(phones['first_lead'])
+
+    delivered = data.loc[data['Delivered'], ['Phone Number', 'Order id', 'Date', 'Aggregate', 'cost']].drop_duplicates('Order id')
+    orders = pd.DataFrame({
+        'phone': delivered['Phone Number'],
+        'order_id': delivered['Order id'],
+        'date': delivered['Date'],
+        'aggregate': delivered['Aggregate'],
+        'cost': delivered['cost'],
+    }).reset_index(drop=True)
+    return phones, orders
+
+
+@timed('cohort')
+def cohort_matrix(phones, orders):
+    # Each order is booked to its lead's first-lead month and its own order
+    # month; one groupby over the joined orders covers every month pair.
+    orders = orders.merge(phones[['phone', 'first_lead', 'lead_month']], on='phone', how='left')
+    orders['conversion_month'] = to_month(orders['date'])
+    orders['days_to_convert'] = (orders['date'] - orders['first_lead']).dt.days
+    matrix = orders.groupby(['lead_month', 'conversion_month']).agg(
+        orders=('order_id', 'size'),
+        converted_leads=('phone', 'nunique'),
+        revenue=('cost', 'sum'),
+        days_to_convert=('days_to_convert', 'mean'),
+    ).reset_index()
+    matrix['revenue'] = matrix['revenue'].round(2)
+    return matrix
+
+
+def cohort_pivot(matrix, value='orders'):
+    if matrix.empty:
+        return pd.DataFrame()
+    months = pd.period_range(min(matrix['lead_month'].min(), matrix['conversion_month'].min()),
+                             max(matrix['lead_month'].max(), matrix['conversion_month'].max()), freq='M')
+    pivot = matrix.pivot(index='lead_month', columns='conversion_month', values=value).reindex(index=months, columns=months)
+    pivot.index = [month_label(month) for month in pivot.index]
+    pivot.columns = [month_label(month) for month in pivot.columns]
+    return pivot
+
+
+def _index_dir(path, cache_dir):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, 'cohort', stem)
+
+
+def load_cohort(path=CALL_LOG_PATH, cache_dir=CACHE_DIR):
+    # The index and matrix live next to the Parquet cache, under the call log's hash
+    root = _index_dir(path, cache_dir)
+    version = fingerprint(path, cache_dir)
+    index_dir = os.path.join(root, version)
+    try:
+        return [pd.read_parquet(os.path.join(index_dir, f'{name}.parquet')) for name in INDEX_FILES]
+    except FileNotFoundError:
+        # Not built yet, or pruned by a worker that saw a newer call log
+        pass
+
+    phones, orders = build_cohort_index(load_call_log(path, columns=COHORT_COLUMNS, cache_dir=cache_dir))
+    tables = [phones, orders, cohort_matrix(phones, orders)]
+    # Workers building the same index each write their own directory; the
+    # first rename wins and the others find the target already there
+    tmp_dir = f'{index_dir}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, table in zip(INDEX_FILES, tables):
+        table.to_parquet(os.path.join(tmp_dir, f'{name}.parquet'), index=False)
+    try:
+        os.replace(tmp_dir, index_dir)
+    except OSError:
+        if not os.path.isdir(index_dir):
+            raise
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    # Older versions go; other workers' tmp directories are left alone
+    for entry in os.listdir(root):
+        if entry != version and not entry.endswith('.tmp'):
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+    return tables
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the lead-month x conversion-month cohort matrix.')
+    parser.add_argument('path', nargs='?', default=CALL_LOG_PATH)
+    parser.add_argument('--value', choices=list(COHORT_VALUES), default='orders')
+    args = parser.parse_args()
+    print(cohort_pivot(load_cohort(args.path)[2], args.value).fillna(0).to_string())
@@ -0,0 +1,134 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from instrument import timed
+from metrics import month_label, phone_partials, to_month
+
+CUBE_COLUMNS = ['Phone Number', 'Created Date', 'ConversationDuration', 'Price', 'Response in Sec',
+                'Delivered', 'Order id', 'Date', 'cost', 'Location', 'Cluster name']
+DIMENSIONS = ['month', 'location', 'cluster']
+MEASURES = ['leads', 'connected_calls', 'follow_ups', 'deliveries', 'revenue', 'phone_cost', 'dm_cost']
+MEASURE_LABELS = {
+    'leads': 'Leads',
+    'connected_calls': 'Leads with a connected call',
+    'follow_ups': 'Follow-ups',
+    'deliveries': 'Orders delivered',
+    'revenue': 'Revenue',
+    'phone_cost': 'Phone cost',
+    'dm_cost': 'DM cost (allocated by leads)',
+}
+RATIO_LABELS = {
+    'cost_per_lead': 'Cost per lead Ratio',
+    'roas': 'Roas',
+    'leads_to_order': 'Leads to Order Ratio',
+    'leads_to_calls': 'Leads to Calls Connected Ratio',
+}
+CUBE_VALUES = {**MEASURE_LABELS, **RATIO_LABELS}
+ALL = 'All'
+UNASSIGNED = 'Unassigned'
+
+
+def member_label(dimension, member):
+    return month_label(pd.Period(member, 'M')) if dimension == 'month' and member != ALL else member
+
+
+def _members(values):
+    return values.astype(object).fillna(UNASSIGNED)
+
+
+def phone_places(data):
+    # Location and cluster are only filled on order rows; a lead takes the
+    # first one recorded against its phone
+    places = data.groupby('Phone Number', observed=True)[['Location', 'Cluster name']].first()
+    return places.apply(_members)
+
+
+def _cells(data):
+    places = phone_places(data)
+    phones = phone_partials(data)
+    phones['location'] = phones['phone'].map(places['Location'])
+    phones['cluster'] = phones['phone'].map(places['Cluster name'])
+    phones['month'] = phones['month'].astype(str)
+    leads = phones.groupby(DIMENSIONS).agg(
+        leads=('phone', 'size'),
+        connected_calls=('connected_calls', lambda calls: (calls > 0).sum()),
+        follow_ups=('connected_calls', lambda calls: (calls > 1).sum()),
+        phone_cost=('price_cents', 'sum'),
+    )
+    leads['phone_cost'] = leads['phone_cost'] / 100
+
+    # Deliveries and revenue are booked to the order month, as in the ratio table
+    delivered = data.loc[data['Delivered'], ['Order id', 'Date', 'cost', 'Location', 'Cluster name']].drop_duplicates('Order id')
+    orders = pd.DataFrame({
+        'month': to_month(delivered['Date']).astype(str),
+        'location': _members(delivered['Location']),
+        'cluster': _members(delivered['Cluster name']),
+        'cost': delivered['cost'].fillna(0),
+    }).groupby(DIMENSIONS).agg(deliveries=('cost', 'size'), revenue=('cost', 'sum'))
+    return leads.join(orders, how='outer').fillna(0)
+
+
+def _allocate_dm_cost(cells, inputs):
+    # DM spend is only known per month; cells get it in proportion to their leads
+    month_leads = cells.groupby(level='month')['leads'].transform('sum')
+    labels = [month_label(pd.Period(month, 'M')) for month in cells.index.get_level_values('month')]
+    dm_cost = inputs['DM_Cost/Month'].reindex(labels).to_numpy(dtype=float)
+    share = (cells['leads'] / month_leads.where(month_leads != 0)).fillna(0)
+    return share * pd.Series(dm_cost, index=cells.index).fillna(0)
+
+
+def _ratio(numerator, denominator):
+    numerator, denominator = np.asarray(numerator, dtype=float), np.asarray(denominator, dtype=float)
+    return np.round(np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0), 3)
+
+
+def derive_ratios(measures):
+    # Works on one cell's measures or a frame of cells alike
+    total_cost = measures['phone_cost'] + measures['dm_cost']
+    return {
+        'cost_per_lead': _ratio(total_cost, measures['leads']),
+        'roas': _ratio(measures['revenue'], total_cost),
+        'leads_to_order': _ratio(measures['deliveries'], measures['leads']),
+        'leads_to_calls': _ratio(measures['connected_calls'], measures['leads']),
+    }
+
+
+# Month x location x cluster cube with every roll-up precomputed. Each
+# grouping set stores ALL for the rolled-up dimensions, so a slice is one
+# dict lookup, a drill-down one cross-section of the sorted index, and
+# ratios are derived from the stored measures on the way out.
+# Months are 'YYYY-MM' keys so they sort chronologically.
+class Cube:
+    def __init__(self, cells):
+        self.cells = cells
+        self.lookup = {key: dict(zip(MEASURES, values)) for key, values in zip(cells.index, cells.to_numpy().tolist())}
+
+    @classmethod
+    @timed('cube')
+    def build(cls, data, inputs):
+        cells = _cells(data)
+        cells['dm_cost'] = _allocate_dm_cost(cells, inputs)
+        cells = cells.reset_index()
+        rollups = []
+        for size in range(len(DIMENSIONS) + 1):
+            for kept in itertools.combinations(DIMENSIONS, size):
+                rolled = cells.groupby(list(kept))[MEASURES].sum().reset_index() if kept else cells[MEASURES].sum().to_frame().T
+                rollups.append(rolled.assign(**{dimension: ALL for dimension in DIMENSIONS if dimension not in kept}))
+        return cls(pd.concat(rollups, ignore_index=True).set_index(DIMENSIONS).sort_index()[MEASURES])
+
+    def members(self, dimension):
+        return sorted(set(self.cells.index.get_level_values(dimension)) - {ALL})
+
+    def slice(self, month=ALL, location=ALL, cluster=ALL):
+        measures = self.lookup.get((month, location, cluster), dict.fromkeys(MEASURES, 0.0))
+        return {**measures, **{name: float(value) for name, value in derive_ratios(measures).items()}}
+
+    def drill(self, dimension, month=ALL, location=ALL, cluster=ALL):
+        # Break one slice down by the members of a dimension
+        fixed = {'month': month, 'location': location, 'cluster': cluster}
+        del fixed[dimension]
+        rows = self.cells.xs(tuple(fixed.values()), level=list(fixed), drop_level=True)
+        rows = rows.drop(index=ALL, errors='ignore')
+        return rows.assign(**derive_ratios(rows)).rename_axis(dimension).reset_index()
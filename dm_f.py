@@ -1,149 +1,311 @@
+import os
+from threading import Lock
+
 import dash
-from dash import dcc, html
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-
-# Load the data
-data = pd.read_csv('anew_2 (3).csv')
-rd_1 = pd.read_csv("final_lead_data_with_ratios.csv")
-rd_1.columns = rd_1.columns.str.strip()  # Clean column names
-
-# Prepare funnel data
-total_leads_count = data['Phone Number'].nunique()
-valid_sales_calls = data[data['ConversationDuration'] > 0]
-unique_phone_calls = valid_sales_calls.drop_duplicates(subset='Phone Number')
-total_unique_sales_calls = len(unique_phone_calls)
-phone_counts = valid_sales_calls['Phone Number'].value_counts()
-repeat_follow_ups = phone_counts[phone_counts > 1]
-total_follow_ups = repeat_follow_ups.count()
-conversions = data[data['Delivered'] == 'Y']
-total_conversions = conversions['Phone Number'].nunique()
-
-funnel_labels = ["Leads", "Sales Call", "Follow Up", "Conversion", "Sale"]
-funnel_vals = [total_leads_count, total_unique_sales_calls, total_follow_ups, total_conversions, total_conversions]
-funnel_data = pd.DataFrame({"Stage": funnel_labels, "Count": funnel_vals})
-funnel_fig = px.funnel(funnel_data, x='Count', y='Stage', title='Sales Funnel')
-
-# Revenue Over Time
-rd_1_filtered = rd_1[rd_1['Lead Month'] != 'Total']
-revenue_fig = px.line(rd_1_filtered, x='Lead Month', y='Revenue_generated/Month', title='Revenue Over Time', markers=True)
-
-# Lead Counts Over Time
-lead_counts_fig = px.bar(rd_1_filtered, x='Lead Month', y='Lead_Count/Month', title='Lead Counts Over Time', text='Lead_Count/Month')
-
-# Grouped Bar Chart
-grouped_bar_fig = px.bar(rd_1, x='Lead Month', y=['Lead_Count/Month', 'Phone_Call_Count/Month', 'Validated_Lead_Count/Month', 'Count _of_Orders _Deliverd /Month'], title='Lead Counts / Phone Calls / Validated Leads / Count of Orders Delivered', barmode='group')
-
-# Dual Axis Bar Chart
-dual_axis_fig = go.Figure()
-dual_axis_fig.add_trace(go.Bar(x=rd_1['Lead Month'], y=rd_1['Total_Cost(DM+Phone_Calls)'], name='Total Cost', marker_color='blue'))
-dual_axis_fig.add_trace(go.Bar(x=rd_1['Lead Month'], y=rd_1['Revenue_generated/Month'], name='Revenue', marker_color='orange'))
-dual_axis_fig.update_layout(title='Cost and Revenue by Month', barmode='group', yaxis_title='Total Cost', yaxis2=dict(title='Revenue', overlaying='y', side='right'))
-
-# Pie Chart for Orders Delivered
-pie_fig = px.pie(rd_1_filtered, names='Lead Month', values='Count _of_Orders _Deliverd /Month', title='Proportion of Orders Delivered by Month')
-
-# Ratios Over Time
-ratios = ['Cost per lead Ratio', 'Cost /confirmed_order_Month_Wise_Ratio', 'Leads to Calls Connected Ratio', 'Leads to validated Lead Ratio', 'Leads to Order Ratio', 'Roas']
-ratios_figs = [px.line(rd_1_filtered, x='Lead Month', y=ratio, title=f'{ratio} Over Months', markers=True) for ratio in ratios]
-
-# Stacked Bar Chart for Leads and Orders
-stacked_fig = go.Figure()
-stacked_fig.add_trace(go.Bar(x=rd_1_filtered['Lead Month'], y=rd_1_filtered['Lead_Count/Month'], name='Lead Count', marker_color='blue', text=rd_1_filtered['Lead_Count/Month'], textposition='auto'))
-stacked_fig.add_trace(go.Bar(x=rd_1_filtered['Lead Month'], y=rd_1_filtered['Phone_Call_Count/Month'], name='Phone Call Count', marker_color='orange', text=rd_1_filtered['Phone_Call_Count/Month'], textposition='auto'))
-stacked_fig.add_trace(go.Bar(x=rd_1_filtered['Lead Month'], y=rd_1_filtered['Validated_Lead_Count/Month'], name='Validated Lead Count', marker_color='green', text=rd_1_filtered['Validated_Lead_Count/Month'], textposition='auto'))
-stacked_fig.add_trace(go.Bar(x=rd_1_filtered['Lead Month'], y=rd_1_filtered['Count _of_Orders _Deliverd /Month'], name='Orders Delivered', marker_color='purple', text=rd_1_filtered['Count _of_Orders _Deliverd /Month'], textposition='auto'))
-
-# Trendlines for the stacked bar chart
-stacked_fig.add_trace(go.Scatter(x=rd_1_filtered['Lead Month'], y=rd_1_filtered['Lead_Count/Month'].cumsum(), mode='lines+markers', name='Lead Count Trend', line=dict(color='blue', width=2, dash='dash')))
-stacked_fig.add_trace(go.Scatter(x=rd_1_filtered['Lead Month'], y=rd_1_filtered['Phone_Call_Count/Month'].cumsum(), mode='lines+markers', name='Phone Call Count Trend', line=dict(color='orange', width=2, dash='dash')))
-stacked_fig.add_trace(go.Scatter(x=rd_1_filtered['Lead Month'], y=rd_1_filtered['Validated_Lead_Count/Month'].cumsum(), mode='lines+markers', name='Validated Lead Count Trend', line=dict(color='green', width=2, dash='dash')))
-stacked_fig.add_trace(go.Scatter(x=rd_1_filtered['Lead Month'], y=rd_1_filtered['Count _of_Orders _Deliverd /Month'].cumsum(), mode='lines+markers', name='Orders Delivered Trend', line=dict(color='purple', width=2, dash='dash')))
-
-stacked_fig.update_layout(title='Monthly Metrics Overview: Leads and Orders', barmode='stack', xaxis_title='Lead Month', yaxis_title='Count', legend_title='Metrics')
-
-# Revenue vs Total Cost
-revenue_cost_fig = go.Figure()
-revenue_cost_fig.add_trace(go.Bar(x=rd_1_filtered['Lead Month'], y=rd_1_filtered['Revenue_generated/Month'], name='Revenue Generated', marker_color='lightblue'))
-revenue_cost_fig.add_trace(go.Bar(x=rd_1_filtered['Lead Month'], y=rd_1_filtered['Total_Cost(DM+Phone_Calls)'], name='Total Cost', marker_color='lightcoral'))
-revenue_cost_fig.update_layout(title='Revenue Generated vs. Total Cost', barmode='group', xaxis_title='Lead Month', yaxis_title='Amount', legend_title='Metrics')
-
-# Initialize the Dash app
+from dash import dcc, html, Input, Output
+from dash.exceptions import PreventUpdate
+from flask import request
+import figures
+from instrument import INSTRUMENTS, stage
+from cohort import COHORT_VALUES, load_cohort
+from cube import ALL, CUBE_VALUES, DIMENSIONS, RATIO_LABELS, Cube, member_label
+from loader import map_call_log, shared_version
+from metrics import CALL_LOG_PATH, METRIC_COLUMNS, load_monthly_inputs
+from precompute import ARTIFACT_ENV, artifact_version, load_artifacts
+from query import FILTER_COLUMNS, CallLogQuery, LRUCache, normalize_filters
+from serving import CACHED_PATHS, install_diagnostics, install_payload_cache
+from timeseries import GRANULARITIES, SERIES, TIMESERIES_COLUMNS
+
+# Artifact mode serves what precompute.py wrote and never touches the call log
+ARTIFACT_DIR = os.environ.get(ARTIFACT_ENV)
+LIVE_COLUMNS = list(dict.fromkeys(METRIC_COLUMNS + FILTER_COLUMNS + TIMESERIES_COLUMNS))
+
+
+def data_version():
+    # Changes when precompute.py or serving.py publishes a refresh
+    if not ARTIFACT_DIR:
+        return shared_version(CALL_LOG_PATH)
+    return artifact_version(ARTIFACT_DIR)
+
+
+def load_data():
+    if ARTIFACT_DIR:
+        current = data_version()
+        artifacts = load_artifacts(ARTIFACT_DIR)
+        return current, artifacts, None, None, artifacts['cohort'], artifacts['cube']
+    # Every worker maps the same Arrow file; filtered aggregations go through the cached query layer
+    current, data = map_call_log(CALL_LOG_PATH, columns=LIVE_COLUMNS)
+    query = CallLogQuery(data, load_monthly_inputs())
+    INSTRUMENTS.register_cache('query', query.cache)
+    return current, None, data, query, load_cohort(CALL_LOG_PATH)[2], Cube.build(data, query.inputs)
+
+
+version = None
+version, artifacts, data, query, cohort, cube = load_data()
+refresh_lock = Lock()
+figure_cache = LRUCache(maxsize=256)
+INSTRUMENTS.register_cache('figure', figure_cache)
+
+FILTER_INPUTS = [
+    Input('date-filter', 'start_date'),
+    Input('date-filter', 'end_date'),
+    Input('month-filter', 'value'),
+    Input('location-filter', 'value'),
+    Input('cluster-filter', 'value'),
+]
+
+
+def zoom_range(relayout):
+    # relayoutData carries the new x range on zoom/pan and autorange on reset
+    if 'xaxis.range[0]' in relayout:
+        return relayout['xaxis.range[0]'], relayout['xaxis.range[1]']
+    if 'xaxis.range' in relayout:
+        return tuple(relayout['xaxis.range'])
+    return None, None
+
+
+def cube_dropdown(dimension):
+    options = [{'label': f'All {dimension}s', 'value': ALL}] + [{'label': member_label(dimension, member), 'value': member} for member in cube.members(dimension)]
+    return dcc.Dropdown(id=f'cube-{dimension}', options=options, value=ALL, clearable=False, style={'minWidth': '180px'})
+
+
+def filter_dropdown(component_id, column, placeholder):
+    return dcc.Dropdown(id=component_id, options=query.options(column), multi=True, placeholder=placeholder,
+                        style={'minWidth': '220px'})
+
+
+def filter_row():
+    return html.Div([
+        dcc.DatePickerRange(id='date-filter', min_date_allowed=data['Created Date'].min(), max_date_allowed=data['Created Date'].max(),
+                            display_format='DD/MM/YYYY', clearable=True),
+        filter_dropdown('month-filter', 'Lead Month', 'Lead Month'),
+        filter_dropdown('location-filter', 'Location', 'Location'),
+        filter_dropdown('cluster-filter', 'Cluster name', 'Cluster name'),
+    ], style={'display': 'flex', 'gap': '12px', 'flexWrap': 'wrap'})
+
+
+def timeseries_controls():
+    return html.Div([
+        dcc.RadioItems(id='timeseries-series', options=[{'label': label, 'value': value} for value, label in SERIES.items()],
+                       value=figures.TIMESERIES_DEFAULT, inline=True),
+        dcc.RadioItems(id='timeseries-granularity', options=[{'label': 'auto', 'value': 'auto'}] + [{'label': level, 'value': level} for level in GRANULARITIES],
+                       value='auto', inline=True),
+    ], style={'display': 'flex', 'gap': '24px', 'flexWrap': 'wrap'})
+
+
+def live_only(build):
+    # Controls that re-query the call log have nothing to query in artifact mode
+    return [] if artifacts else [build()]
+
+
+def graph(graph_id):
+    if artifacts:
+        return dcc.Graph(id=graph_id, figure=artifacts['dash'][graph_id])
+    return dcc.Graph(id=graph_id)
+
+
+def live_callback(*args):
+    return (lambda callback: callback) if artifacts else app.callback(*args)
+
+
+# Initialize the Dash app; `gunicorn --preload dm_f:server` serves it with several workers
 app = dash.Dash(__name__)
+server = app.server
 
-# Define the layout of the app
-app.layout = html.Div([
-    html.H1("Digital Marketing Dashboard From April to September 2024", style={'textAlign': 'center'}),
+
+@server.before_request
+def pick_up_refresh():
+    # Re-map after a publish without restarting the worker
+    global version, artifacts, data, query, cohort, cube
+    if request.path in CACHED_PATHS and data_version() != version:
+        with refresh_lock:
+            if data_version() != version:
+                version, artifacts, data, query, cohort, cube = load_data()
+                figure_cache.clear()
+
+
+payload_cache = install_payload_cache(server, lambda: version)
+INSTRUMENTS.register_cache('payload', payload_cache)
+install_diagnostics(server)
+
+
+# Define the layout of the app; built per page load so a refresh shows its own filter options
+def serve_layout():
+    return html.Div([
+        html.H1("Digital Marketing Dashboard From April to September 2024", style={'textAlign': 'center'}),
+
+        # Filters
+        *live_only(filter_row),
+        html.Hr(),  # Horizontal line
     
-    # Sales Funnel
-    dcc.Graph(figure=funnel_fig, id='funnel-graph'),
-    html.Div("**1. Sales Funnel:** This funnel chart illustrates the sales process from leads to conversions."),
-    html.P("Funnel: Leads -> Calls -> Follow-ups -> Conversions."),
-    html.Hr(),  # Horizontal line
-
-    # Revenue Over Time
-    dcc.Graph(figure=revenue_fig, id='revenue-graph'),
-    html.Div("**2. Revenue Over Time:** This plot shows the total revenue generated each month."),
-    html.Hr(),  # Horizontal line
-
-    # Lead Counts Over Time
-    dcc.Graph(figure=lead_counts_fig, id='lead-counts-graph'),
-    html.Div("**3. Lead Counts Over Time:** This bar chart represents the number of leads generated each month."),
-    html.Hr(),  # Horizontal line
-
-    # Cost and Revenue by Month
-    dcc.Graph(figure=grouped_bar_fig, id='grouped-bar-graph'),
-    html.Div("**4. Cost and Revenue by Month:** This chart compares total costs with revenue for each month."),
-    html.Div("**Note:** Validated lead data is not available for April month."),
-    html.Div("Validated data means when our telecaller team calls a lead and the lead expresses interest or requests more information."),
-    html.Hr(),  # Horizontal line
-
-    # Dual Axis Bar Chart
-    dcc.Graph(figure=dual_axis_fig, id='dual-axis-graph'),
-    html.Hr(),  # Horizontal line
-
-    # Pie Chart for Orders Delivered
-    dcc.Graph(figure=pie_fig, id='pie-graph'),
-    html.Div("**5. Proportion of Orders Delivered:** This pie chart shows the proportion of orders delivered for each month."),
-    html.Hr(),  # Horizontal line
-
-    # Display each ratio figure with notes
-    html.Div([  
-        dcc.Graph(figure=ratios_figs[0], id='cost-per-lead-graph'),
-        html.Div("**6. Cost per Lead Ratio:** This plot shows the cost incurred for each lead over time. **Cost per Lead = Total Costs / Leads**"),
+        # Sales Funnel
+        graph('funnel-graph'),
+        html.Div("**1. Sales Funnel:** This funnel chart illustrates the sales process from leads to conversions."),
+        html.P("Funnel: Leads -> Calls -> Follow-ups -> Conversions."),
+        html.Hr(),  # Horizontal line
+
+        # Revenue Over Time
+        graph('revenue-graph'),
+        html.Div("**2. Revenue Over Time:** This plot shows the total revenue generated each month."),
         html.Hr(),  # Horizontal line
 
-        dcc.Graph(figure=ratios_figs[1], id='cost-per-confirmed-order-graph'),
-        html.Div("**7. Cost per Confirmed Order Ratio:** This plot shows the cost incurred for each confirmed order over time. **Cost per Confirmed Order = Total revenue generated in a particular month / Confirmed Orders**"),
+        # Lead Counts Over Time
+        graph('lead-counts-graph'),
+        html.Div("**3. Lead Counts Over Time:** This bar chart represents the number of leads generated each month."),
         html.Hr(),  # Horizontal line
 
-        dcc.Graph(figure=ratios_figs[2], id='leads-to-calls-graph'),
-        html.Div("**8. Leads to Calls Connected Ratio:** This plot shows the ratio of leads that resulted in connected calls. **Leads to Calls Ratio = Connected Calls / Total Leads**"),
+        # Cost and Revenue by Month
+        graph('grouped-bar-graph'),
+        html.Div("**4. Cost and Revenue by Month:** This chart compares total costs with revenue for each month."),
+        html.Div("**Note:** Validated lead data is not available for April month."),
+        html.Div("Validated data means when our telecaller team calls a lead and the lead expresses interest or requests more information."),
         html.Hr(),  # Horizontal line
 
-        dcc.Graph(figure=ratios_figs[3], id='leads-to-validated-graph'),
-        html.Div("**9. Leads to Validated Lead Ratio:** This plot shows the ratio of leads that were validated. **Leads to Validated Leads Ratio = Validated Leads / Total Leads**"),
+        # Dual Axis Bar Chart
+        graph('dual-axis-graph'),
         html.Hr(),  # Horizontal line
 
-        dcc.Graph(figure=ratios_figs[4], id='leads-to-order-graph'),
-        html.Div("**10. Leads to Order Ratio:** This plot shows the ratio of leads that resulted in confirmed orders. **Leads to Order Ratio = Total Order Count / Total Leads**"),
+        # Pie Chart for Orders Delivered
+        graph('pie-graph'),
+        html.Div("**5. Proportion of Orders Delivered:** This pie chart shows the proportion of orders delivered for each month."),
         html.Hr(),  # Horizontal line
 
-        dcc.Graph(figure=ratios_figs[5], id='roas-graph'),
-        html.Div("**11. Return on Advertising Spend (ROAS):** This plot shows the return on advertising spend over time. **ROAS = Revenue / Advertising Spend (Total Costs, where total cost is equal to the call cost of all leads plus digital marketing costs per month).**"),
+        # Display each ratio figure with notes
+        html.Div([  
+            graph('cost-per-lead-graph'),
+            html.Div("**6. Cost per Lead Ratio:** This plot shows the cost incurred for each lead over time. **Cost per Lead = Total Costs / Leads**"),
+            html.Hr(),  # Horizontal line
+
+            graph('cost-per-confirmed-order-graph'),
+            html.Div("**7. Cost per Confirmed Order Ratio:** This plot shows the cost incurred for each confirmed order over time. **Cost per Confirmed Order = Total revenue generated in a particular month / Confirmed Orders**"),
+            html.Hr(),  # Horizontal line
+
+            graph('leads-to-calls-graph'),
+            html.Div("**8. Leads to Calls Connected Ratio:** This plot shows the ratio of leads that resulted in connected calls. **Leads to Calls Ratio = Connected Calls / Total Leads**"),
+            html.Hr(),  # Horizontal line
+
+            graph('leads-to-validated-graph'),
+            html.Div("**9. Leads to Validated Lead Ratio:** This plot shows the ratio of leads that were validated. **Leads to Validated Leads Ratio = Validated Leads / Total Leads**"),
+            html.Hr(),  # Horizontal line
+
+            graph('leads-to-order-graph'),
+            html.Div("**10. Leads to Order Ratio:** This plot shows the ratio of leads that resulted in confirmed orders. **Leads to Order Ratio = Total Order Count / Total Leads**"),
+            html.Hr(),  # Horizontal line
+
+            graph('roas-graph'),
+            html.Div("**11. Return on Advertising Spend (ROAS):** This plot shows the return on advertising spend over time. **ROAS = Revenue / Advertising Spend (Total Costs, where total cost is equal to the call cost of all leads plus digital marketing costs per month).**"),
+            html.Hr(),  # Horizontal line
+        ]),
+
+        # Stacked Bar Chart for Leads and Orders
+        graph('stacked-graph'),
+        html.Div("**12. Monthly Metrics Overview:** This stacked bar chart provides insights into leads and orders for each month."),
+        html.Hr(),  # Horizontal line
+
+        # Revenue vs Total Cost
+        graph('revenue-cost-graph'),
+        html.Div("**13. Revenue Generated vs. Total Cost:** This chart compares revenue generated with total costs for each month."),
+        html.Hr(),  # Horizontal line
+
+        # First response latency
+        graph('latency-histogram-graph'),
+        html.Div("**14. First Response Time Distribution:** Hours from lead creation to the first call and to the first connected call, per lead."),
+        html.Hr(),  # Horizontal line
+
+        graph('latency-trend-graph'),
+        html.Div("**15. First Response Time Percentiles:** Median (p50), p90 and p99 first response time for each lead month."),
+        html.Hr(),  # Horizontal line
+
+        graph('latency-cluster-graph'),
+        html.Div("**16. First Response Time by Cluster:** Percentiles of the first call response time per cluster; leads without an order have no cluster."),
+        html.Hr(),  # Horizontal line
+
+        # Lead month x conversion month cohorts
+        dcc.RadioItems(id='cohort-value', options=[{'label': label, 'value': value} for value, label in COHORT_VALUES.items()],
+                       value=figures.COHORT_DEFAULT, inline=True),
+        graph('cohort-graph'),
+        html.Div("**17. Conversion Cohorts:** Each row is the month a lead first came in, each column the month its order was placed. The whole call log is used, regardless of the filters above."),
+        html.Hr(),  # Horizontal line
+
+        # Call activity over time
+        *live_only(timeseries_controls),
+        graph('timeseries-graph'),
+        html.Div("**18. Call Activity Over Time:** Calls, connected calls, conversation minutes or phone cost by call time. Zoom in to re-query at hour or single-call resolution."),
         html.Hr(),  # Horizontal line
-    ]),
 
-    # Stacked Bar Chart for Leads and Orders
-    dcc.Graph(figure=stacked_fig, id='stacked-graph'),
-    html.Div("**12. Monthly Metrics Overview:** This stacked bar chart provides insights into leads and orders for each month."),
-    html.Hr(),  # Horizontal line
+        # Drill-down by month, location and cluster
+        html.Div([
+            *[cube_dropdown(dimension) for dimension in DIMENSIONS],
+            dcc.RadioItems(id='cube-breakdown', options=[{'label': f'by {dimension}', 'value': dimension} for dimension in DIMENSIONS],
+                           value=figures.CUBE_DEFAULT_BREAKDOWN, inline=True),
+            dcc.Dropdown(id='cube-measure', options=[{'label': label, 'value': value} for value, label in CUBE_VALUES.items()],
+                         value=figures.CUBE_DEFAULT_MEASURE, clearable=False, style={'minWidth': '260px'}),
+        ], style={'display': 'flex', 'gap': '12px', 'flexWrap': 'wrap', 'alignItems': 'center'}),
+        html.Div(id='cube-summary'),
+        graph('cube-graph'),
+        html.Div("**19. Drill-down:** Pick a month, location and cluster, then break the selection down by one of them. Location and cluster come from a lead's order, so leads without one are Unassigned; DM cost is split across locations and clusters by lead count."),
+    ])
+
+
+app.layout = serve_layout
+
+
+def cached_figure(name, key, build):
+    def timed_build():
+        with stage(f'figure/{name}'):
+            return build()
+    return figure_cache.get_or_compute((name, key), timed_build)
+
+
+@live_callback(Output('funnel-graph', 'figure'), *FILTER_INPUTS)
+def update_funnel(*filters):
+    key = normalize_filters(*filters)
+    return cached_figure('funnel-graph', key, lambda: figures.funnel_figure(query.funnel(key)))
+
+
+@live_callback([Output(graph_id, 'figure') for graph_id, _ in figures.DASH_MONTHLY_GRAPHS], *FILTER_INPUTS)
+def update_monthly_graphs(*filters):
+    key = normalize_filters(*filters)
+    return [cached_figure(graph_id, key, lambda build=build: build(query.monthly(key))) for graph_id, build in figures.DASH_MONTHLY_GRAPHS]
+
+
+@live_callback([Output(graph_id, 'figure') for graph_id in figures.DASH_RATIO_GRAPHS], *FILTER_INPUTS)
+def update_ratio_graphs(*filters):
+    key = normalize_filters(*filters)
+    return cached_figure('ratio-graphs', key, lambda: figures.dash_ratio_figures(query.monthly(key)))
+
+
+@live_callback([Output(graph_id, 'figure') for graph_id in figures.DASH_LATENCY_GRAPHS], *FILTER_INPUTS)
+def update_latency_graphs(*filters):
+    key = normalize_filters(*filters)
+    return cached_figure('latency-graphs', key, lambda: list(figures.latency_figures(query.latency(key)).values()))
+
+
+@app.callback(Output('cohort-graph', 'figure'), Input('cohort-value', 'value'))
+def update_cohort_graph(value):
+    return cached_figure('cohort-graph', value, lambda: figures.cohort_heatmap_figure(cohort, value))
+
+
+@live_callback(Output('timeseries-graph', 'figure'), Input('timeseries-series', 'value'), Input('timeseries-granularity', 'value'),
+              Input('timeseries-graph', 'relayoutData'), *FILTER_INPUTS)
+def update_timeseries_graph(series, granularity, relayout, *filters):
+    relayout = relayout or {}
+    start, end = zoom_range(relayout)
+    if dash.ctx.triggered_id == 'timeseries-graph' and start is None and 'xaxis.autorange' not in relayout:
+        # Not a zoom (e.g. a legend click); keep the current figure
+        raise PreventUpdate
+    key = normalize_filters(*filters)
+    build = lambda: figures.timeseries_figure(series, *query.timeseries(key).query(series, start, end, granularity))
+    return cached_figure('timeseries-graph', (key, series, granularity, start, end), build)
+
+
+@app.callback(Output('cube-summary', 'children'), Output('cube-graph', 'figure'),
+              *[Input(f'cube-{dimension}', 'value') for dimension in DIMENSIONS], Input('cube-breakdown', 'value'), Input('cube-measure', 'value'))
+def update_cube(month, location, cluster, breakdown, measure):
+    selected = cube.slice(month, location, cluster)
+    summary = ' | '.join(f'{label}: {selected[value]:,.{3 if value in RATIO_LABELS else 0}f}' for value, label in CUBE_VALUES.items())
+    return summary, figures.cube_drill_figure(cube.drill(breakdown, month, location, cluster), breakdown, measure)
 
-    # Revenue vs Total Cost
-    dcc.Graph(figure=revenue_cost_fig, id='revenue-cost-graph'),
-    html.Div("**13. Revenue Generated vs. Total Cost:** This chart compares revenue generated with total costs for each month."),
-])
 
 # Run the server
 if __name__ == '__main__':
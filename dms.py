@@ -1,221 +1,177 @@
-import streamlit as st
+import os
+import time
+
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import io
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Border, Side
-from openpyxl.comments import Comment
-
-data = pd.read_csv('anew_2 (3).csv')
-rd_1 = pd.read_csv("final_lead_data_with_ratios.csv")
-rd_1.columns = rd_1.columns.str.strip()
-
-total_leads_count = data['Phone Number'].nunique()
-valid_sales_calls = data[data['ConversationDuration'] > 0]
-unique_phone_calls = valid_sales_calls.drop_duplicates(subset='Phone Number')
-total_unique_sales_calls = len(unique_phone_calls)
-phone_counts = valid_sales_calls['Phone Number'].value_counts()
-repeat_follow_ups = phone_counts[phone_counts > 1]
-total_follow_ups = repeat_follow_ups.count()
-conversions = data[data['Delivered'] == 'Y']
-total_conversions = conversions['Phone Number'].nunique()
-
-funnel_labels = ["Leads", "Sales Call", "Follow Up", "Conversion", "Sale"]
-funnel_vals = [total_leads_count, total_unique_sales_calls, total_follow_ups, total_conversions, total_conversions]
-funnel_data = pd.DataFrame({"Stage": funnel_labels, "Count": funnel_vals})
-funnel_fig = px.funnel(funnel_data, x='Count', y='Stage', title='Sales Funnel')
-
-rd_1_filtered = rd_1[rd_1['Lead Month'] != 'Total']
-revenue_fig = px.line(rd_1_filtered, x='Lead Month', y='Revenue_generated/Month', title='Revenue Over Time', markers=True)
-lead_counts_fig = px.bar(rd_1_filtered, x='Lead Month', y='Lead_Count/Month', title='Lead Counts Over Time', text='Lead_Count/Month')
-grouped_bar_fig = px.bar(rd_1, x='Lead Month', y=['Lead_Count/Month', 'Phone_Call_Count/Month', 'Validated_Lead_Count/Month', 'Count _of_Orders _Deliverd /Month'], title='Lead Counts / Phone Calls / Validated Leads / Count of Orders Delivered', barmode='group')
-
-dual_axis_fig = go.Figure()
-dual_axis_fig.add_trace(go.Bar(x=rd_1['Lead Month'], y=rd_1['Total_Cost(DM+Phone_Calls)'], name='Total Cost', marker_color='blue'))
-dual_axis_fig.add_trace(go.Bar(x=rd_1['Lead Month'], y=rd_1['Revenue_generated/Month'], name='Revenue', marker_color='orange'))
-dual_axis_fig.update_layout(title='Cost and Revenue by Lead Month', barmode='group', yaxis_title='Total Cost', yaxis2=dict(title='Revenue', overlaying='y', side='right'))
-
-pie_fig = px.pie(rd_1_filtered, names='Lead Month', values='Count _of_Orders _Deliverd /Month', title='Proportion of Orders Delivered by Lead Month')
-
-ratios = ['Cost per lead Ratio', 'Cost /confirmed_order_Month_Wise_Ratio', 'Leads to Calls Connected Ratio', 'Leads to validated Lead Ratio', 'Leads to Order Ratio', 'Roas']
-ratios_figs = [px.line(rd_1_filtered, x='Lead Month', y=ratio, title=f'{ratio} Over Lead Months', markers=True) for ratio in ratios]
-
-stacked_fig = go.Figure()
-metrics = [
-    ('Lead_Count/Month', 'blue', 'Lead Count'),
-    ('Phone_Call_Count/Month', 'orange', 'Phone Call Count'),
-    ('Validated_Lead_Count/Month', 'green', 'Validated Lead Count'),
-    ('Count _of_Orders _Deliverd /Month', 'purple', 'Orders Delivered')
-]
-
-for metric, color, name in metrics:
-    stacked_fig.add_trace(go.Bar(
-        x=rd_1_filtered['Lead Month'], 
-        y=rd_1_filtered[metric], 
-        name=name, 
-        marker_color=color, 
-        text=rd_1_filtered[metric], 
-        textposition='auto'
-    ))
-
-stacked_fig.update_layout(
-    title='Monthly Metrics Overview: Leads and Orders',
-    barmode='stack', 
-    xaxis_title='Lead Month', 
-    yaxis_title='Count', 
-    legend_title='Metrics'
-)
-
-revenue_cost_fig = go.Figure()
-revenue_cost_fig.add_trace(go.Bar(x=rd_1_filtered['Lead Month'], y=rd_1_filtered['Revenue_generated/Month'], name='Revenue Generated', marker_color='lightblue'))
-revenue_cost_fig.add_trace(go.Bar(x=rd_1_filtered['Lead Month'], y=rd_1_filtered['Total_Cost(DM+Phone_Calls)'], name='Total Cost', marker_color='lightcoral'))
-revenue_cost_fig.update_layout(title='Revenue Generated vs. Total Cost', barmode='group', xaxis_title='Lead Month', yaxis_title='Amount', legend_title='Metrics')
-
-rd_1.columns = rd_1.columns.str.replace(' ', '_').str.replace('/', '_').str.replace('__', '_').str.strip()
-filtered_rd_1 = rd_1[rd_1['Lead_Month'] != 'Total']
-
-trend_fig = go.Figure()
-trend_fig.add_trace(go.Scatter(
-    x=filtered_rd_1['Lead_Month'],
-    y=filtered_rd_1['Lead_Count_Month'].cumsum(),
-    mode='lines+markers',
-    name='Lead Count Trend',
-    line=dict(color='blue', width=2, dash='dash')
-))
-trend_fig.add_trace(go.Scatter(
-    x=filtered_rd_1['Lead_Month'],
-    y=filtered_rd_1['Phone_Call_Count_Month'].cumsum(),
-    mode='lines+markers',
-    name='Phone Call Count Trend',
-    line=dict(color='orange', width=2, dash='dash')
-))
-trend_fig.add_trace(go.Scatter(
-    x=filtered_rd_1['Lead_Month'],
-    y=filtered_rd_1['Validated_Lead_Count_Month'].cumsum(),
-    mode='lines+markers',
-    name='Validated Lead Count Trend',
-    line=dict(color='green', width=2, dash='dash')
-))
-trend_fig.add_trace(go.Scatter(
-    x=filtered_rd_1['Lead_Month'],
-    y=filtered_rd_1['Count_of_Orders_Deliverd_Month'].cumsum(),
-    mode='lines+markers',
-    name='Orders Delivered Trend',
-    line=dict(color='purple', width=2, dash='dash')
-))
-
-trend_fig.update_layout(
-    title='Trend Lines Overview: Leads and Orders',
-    xaxis_title='Month',
-    yaxis_title='Count',
-    legend_title='Metrics',
-    template='plotly'
-)
+import streamlit as st
+from cohort import COHORT_VALUES, load_cohort
+from cube import ALL, CUBE_COLUMNS, CUBE_VALUES, DIMENSIONS, MEASURE_LABELS, RATIO_LABELS, Cube, member_label
+import instrument
+from export import XLSX_MIME, display_columns, export_workbook, lead_data_sheets, raw_log_sheet
+from instrument import INSTRUMENTS, STAGE_FIELDS, profile_report
+from latency import LATENCY_COLUMNS, compute_latency
+from loader import fingerprint, load_call_log, stat_fingerprint
+from metrics import CALL_LOG_PATH, METRIC_COLUMNS, MONTHLY_INPUTS_PATH, compute_funnel, compute_monthly_metrics, load_monthly_inputs
+from precompute import ARTIFACT_ENV, artifact_version, load_artifacts
+from timeseries import GRANULARITIES, SERIES, TIMESERIES_COLUMNS, CallTimeSeries
+import figures
+
+# Cached entries are keyed on the input fingerprints, so a changed call log
+# or cost sheet is picked up on the next rerun and stale entries age out.
+MAX_CACHE_ENTRIES = 4
+
+# Artifact mode serves what precompute.py wrote and never touches the call log
+ARTIFACT_DIR = os.environ.get(ARTIFACT_ENV)
+
+
+@st.cache_data(max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def load_tables(call_log_key, inputs_key):
+    data = load_call_log(CALL_LOG_PATH, columns=METRIC_COLUMNS)
+    rd_1 = compute_monthly_metrics(data, load_monthly_inputs())
+    return compute_funnel(data), rd_1
+
+
+@st.cache_data(max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def load_latency(call_log_key):
+    return compute_latency(load_call_log(CALL_LOG_PATH, columns=LATENCY_COLUMNS))
+
+
+@st.cache_data(max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def load_cohort_matrix(call_log_key):
+    return load_cohort(CALL_LOG_PATH)[2]
+
+
+@st.cache_resource(max_entries=MAX_CACHE_ENTRIES * len(COHORT_VALUES), show_spinner=False)
+def cohort_figure(call_log_key, value):
+    return figures.cohort_heatmap_figure(load_cohort_matrix(call_log_key), value)
+
+
+@st.cache_resource(max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def load_timeseries(call_log_key):
+    return CallTimeSeries(load_call_log(CALL_LOG_PATH, columns=TIMESERIES_COLUMNS))
+
+
+@st.cache_resource(max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def load_cube(call_log_key, inputs_key):
+    return Cube.build(load_call_log(CALL_LOG_PATH, columns=CUBE_COLUMNS), load_monthly_inputs())
+
+
+@st.cache_data(max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def display_table(call_log_key, inputs_key):
+    return display_columns(load_tables(call_log_key, inputs_key)[1])
+
+
+@st.cache_resource(max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def build_figures(call_log_key, inputs_key):
+    figs = figures.streamlit_figures(*load_tables(call_log_key, inputs_key))
+    figs.update(figures.latency_figures(load_latency(call_log_key)))
+    return figs
+
+
+@st.cache_data(max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def csv_export(call_log_key, inputs_key):
+    return display_table(call_log_key, inputs_key).to_csv(index=False)
+
+
+@st.cache_data(max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def excel_export(call_log_key, inputs_key):
+    funnel_vals, rd_1 = load_tables(call_log_key, inputs_key)
+    return export_workbook(lead_data_sheets(rd_1, funnel_vals))
+
+
+@st.cache_data(max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def call_log_export(call_log_key):
+    # Writing the raw log runs at a few thousand rows a second, so it is its
+    # own download and only built when asked for
+    return export_workbook([raw_log_sheet(CALL_LOG_PATH)])
+
+
+@st.cache_resource(max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def load_artifact_set(manifest_key):
+    return load_artifacts(ARTIFACT_DIR)
+
+
+@st.cache_data(max_entries=MAX_CACHE_ENTRIES, show_spinner=False)
+def artifact_bytes(path, manifest_key):
+    with open(path, 'rb') as artifact:
+        return artifact.read()
+
+
+run_start = time.perf_counter()
+if ARTIFACT_DIR:
+    manifest_key = artifact_version(ARTIFACT_DIR)
+    artifacts = load_artifact_set(manifest_key)
+    figs, table, cube = artifacts['streamlit'], artifacts['lead_data'], artifacts['cube']
+    csv_data = lambda: artifact_bytes(artifacts['lead_data_csv'], manifest_key)
+    excel_data = lambda: artifact_bytes(artifacts['lead_data_xlsx'], manifest_key)
+else:
+    artifacts = None
+    call_log_key = fingerprint(CALL_LOG_PATH)
+    inputs_key = stat_fingerprint(MONTHLY_INPUTS_PATH)
+    figs, table, cube = build_figures(call_log_key, inputs_key), display_table(call_log_key, inputs_key), load_cube(call_log_key, inputs_key)
+    csv_data = lambda: csv_export(call_log_key, inputs_key)
+    excel_data = lambda: excel_export(call_log_key, inputs_key)
 
 st.title("Digital Marketing Dashboard From April to September 2024")
 st.write("### Lead Data Overview")
-st.dataframe(rd_1)
-
-csv = rd_1.to_csv(index=False)
-st.download_button(
-    label="Download Lead Data as CSV",
-    data=csv,
-    file_name='lead_data.csv',
-    mime='text/csv'
-)
-
-excel_buffer = io.BytesIO()
-with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-    rd_1.to_excel(writer, index=False, sheet_name='Lead Data')
-    workbook = writer.book
-    worksheet = writer.sheets['Lead Data']
-
-    yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-    for cell in worksheet[1]:
-        cell.fill = yellow_fill
-
-    thin_border = Border(left=Side(style='thin'),
-                         right=Side(style='thin'),
-                         top=Side(style='thin'),
-                         bottom=Side(style='thin'))
-
-    for row in worksheet.iter_rows(min_row=1, max_row=worksheet.max_row, min_col=1, max_col=worksheet.max_column):
-        for cell in row:
-            cell.border = thin_border
-
-    for cell in worksheet[worksheet.max_row]:
-        cell.font = Font(bold=True)
-
-    comments = {
-        'Cost per lead Ratio': "Cost per Lead = Total Costs / Leads",
-        'Cost /confirmed_order_Month_Wise_Ratio': "Cost per Confirmed Order = Total revenue generated in a particular month / Confirmed Orders",
-        'Leads to Calls Connected Ratio': "Leads to Calls Ratio = Connected Calls / Total Leads",
-        'Leads to validated Lead Ratio': "Validated Leads / Total Leads",
-        'Leads to Order Ratio': "Total Order Count / Total Leads",
-        'Roas': "Revenue / Advertising Spend (Total Costs, where total cost is equal to the call cost of all leads plus digital marketing costs per month.)",
-        'Time to reach out to the lead Whether the person had answered the call or not is irrelevant': "Ratio (Days) = Response in Days / Time to Reach Out (Days)",
-        'Time to reach out to the lead when conversation happen': "Ratio (Days) = Response in Days / Time to Reach Out (Days)",
-        'Cost per validated lead': "Cost per validated Leads Ratio = Total count of validated leads / Total cost"
-    }
-
-    for col_name, comment_text in comments.items():
-        if col_name in rd_1.columns:
-            col_index = rd_1.columns.get_loc(col_name) + 1
-            cell = worksheet.cell(row=1, column=col_index)
-            cell.comment = Comment(comment_text, "System")
-
-    notes = [
-        "Cost per Lead = Total Costs / Leads",
-        "Cost per Confirmed Order = Total revenue generated in a particular month / Confirmed Orders",
-        "Leads to Calls Ratio = Connected Calls / Total Leads",
-        "Validated Leads Ratio = Validated Leads / Total Leads",
-        "Leads to Order Ratio = Orders / Total Leads",
-        "Revenue / Advertising Spend (Total Costs, where total cost is equal to the call cost of all leads plus digital marketing costs per month.)",
-        "",
-        "Note: Validated lead data is not available for April month. (Validated data means when our telecaller team calls a lead and the lead expresses interest or requests more information.)"
-    ]
-
-    start_row = worksheet.max_row + 2
-    for i, note in enumerate(notes):
-        worksheet.cell(row=start_row + i, column=1, value=note)
-
-excel_buffer.seek(0)
-
-st.download_button(
-    label="Download Lead Data as Excel",
-    data=excel_buffer,
-    file_name='lead_data.xlsx',
-    mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-)
-
-st.plotly_chart(funnel_fig)
+st.dataframe(table)
+
+# Export bytes are only built once somebody asks for them
+if st.button("Prepare Lead Data downloads"):
+    st.session_state['exports_requested'] = True
+
+if st.session_state.get('exports_requested'):
+    st.download_button(
+        label="Download Lead Data as CSV",
+        data=csv_data(),
+        file_name='lead_data.csv',
+        mime='text/csv'
+    )
+
+    st.download_button(
+        label="Download Lead Data as Excel",
+        data=excel_data(),
+        file_name='lead_data.xlsx',
+        mime=XLSX_MIME
+    )
+
+if not artifacts and st.button("Prepare the raw call log as Excel (slow for large logs)"):
+    st.session_state['call_log_export_requested'] = True
+
+if not artifacts and st.session_state.get('call_log_export_requested'):
+    st.download_button(
+        label="Download the raw call log as Excel",
+        data=call_log_export(call_log_key),
+        file_name='call_log.xlsx',
+        mime=XLSX_MIME
+    )
+
+st.plotly_chart(figs['funnel'])
 st.write("**1. Sales Funnel:** This funnel chart illustrates the sales process from leads to conversions.")
 st.write("Funnel: Leads -> Calls -> Follow-ups -> Conversions.")
 st.markdown("---")
 
-st.plotly_chart(revenue_fig)
+st.plotly_chart(figs['revenue'])
 st.write("**2. Revenue Over Time:** This plot shows the total revenue generated each month.")
 st.markdown("---")
 
-st.plotly_chart(lead_counts_fig)
+st.plotly_chart(figs['lead_counts'])
 st.write("**3. Lead Counts Over Time:** This bar chart represents the number of leads generated each month.")
 st.markdown("---")
 
-st.plotly_chart(grouped_bar_fig)
+st.plotly_chart(figs['grouped_bar'])
 st.write("**4. Cost and Revenue by Month:** This chart compares total costs with revenue for each month.")
 st.write("**Note:** Validated lead data is not available for April month.")
 st.write("Validated data means when our telecaller team calls a lead and the lead expresses interest or requests more information.")
 st.markdown("---")
 
-st.plotly_chart(dual_axis_fig)
+st.plotly_chart(figs['dual_axis'])
 st.markdown("---")
 
-st.plotly_chart(pie_fig)
+st.plotly_chart(figs['pie'])
 st.write("**5. Proportion of Orders Delivered:** This pie chart shows the proportion of orders delivered for each month.")
 st.markdown("---")
 
-for i, (ratio_fig, description) in enumerate(zip(ratios_figs, [
+for i, (ratio_fig, description) in enumerate(zip(figs['ratios'], [
     "Cost per Lead Ratio: This plot shows the cost incurred for each lead over time.",
     "Cost per Confirmed Order Ratio: This plot shows the cost incurred for each confirmed order over time.",
     "Leads to Calls Connected Ratio: This plot shows the ratio of leads that resulted in connected calls.",
@@ -227,6 +183,78 @@ for i, (ratio_fig, description) in enumerate(zip(ratios_figs, [
     st.write(f"**{i + 6}. {description}**")
     st.markdown("---")
 
-st.plotly_chart(trend_fig)
+st.plotly_chart(figs['trend'])
 st.write("**14. Trend Lines Overview:** This chart shows the trends in lead counts and orders delivered over time.")
 st.markdown("---")
+
+st.plotly_chart(figs['latency_histogram'])
+st.write("**15. First Response Time Distribution:** Hours from lead creation to the first call and to the first connected call, per lead.")
+st.markdown("---")
+
+st.plotly_chart(figs['latency_trend'])
+st.write("**16. First Response Time Percentiles:** Median (p50), p90 and p99 first response time for each lead month.")
+st.markdown("---")
+
+st.plotly_chart(figs['latency_cluster'])
+st.write("**17. First Response Time by Cluster:** Percentiles of the first call response time per cluster; leads without an order have no cluster.")
+st.markdown("---")
+
+cohort_value = st.radio("Cohort measure", list(COHORT_VALUES), format_func=COHORT_VALUES.get, horizontal=True)
+st.plotly_chart(figures.cohort_heatmap_figure(artifacts['cohort'], cohort_value) if artifacts else cohort_figure(call_log_key, cohort_value))
+st.write("**18. Conversion Cohorts:** Each row is the month a lead first came in, each column the month its order was placed.")
+st.markdown("---")
+
+if artifacts:
+    st.plotly_chart(figs['timeseries'])
+else:
+    timeseries = load_timeseries(call_log_key)
+    first_call, last_call = timeseries.bounds()
+    series = st.selectbox("Call activity measure", list(SERIES), format_func=SERIES.get)
+    granularity = st.radio("Resolution", ['auto'] + GRANULARITIES, horizontal=True)
+    # Narrowing the window re-queries at a finer resolution, like zooming in the Dash app
+    window = st.date_input("Call window", value=(first_call.date(), last_call.date()), min_value=first_call.date(), max_value=last_call.date())
+    start, end = (pd.Timestamp(window[0]), pd.Timestamp(window[1]) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)) if len(window) == 2 else (None, None)
+    st.plotly_chart(figures.timeseries_figure(series, *timeseries.query(series, start, end, granularity)))
+st.write("**19. Call Activity Over Time:** Calls, connected calls, conversation minutes or phone cost by call time.")
+st.markdown("---")
+
+selection = {}
+for column, dimension in zip(st.columns(len(DIMENSIONS)), DIMENSIONS):
+    selection[dimension] = column.selectbox(dimension.title(), [ALL] + cube.members(dimension),
+                                            format_func=lambda member, dimension=dimension: member_label(dimension, member))
+breakdown = st.radio("Break down by", DIMENSIONS, index=DIMENSIONS.index(figures.CUBE_DEFAULT_BREAKDOWN), horizontal=True)
+measure = st.selectbox("Drill-down measure", list(CUBE_VALUES), format_func=CUBE_VALUES.get)
+selected = cube.slice(**selection)
+for column, (value, label) in zip(st.columns(len(RATIO_LABELS)), RATIO_LABELS.items()):
+    column.metric(label, f'{selected[value]:.3f}')
+for column, (value, label) in zip(st.columns(len(MEASURE_LABELS)), MEASURE_LABELS.items()):
+    column.metric(label, f'{selected[value]:,.0f}')
+drill = cube.drill(breakdown, **selection)
+st.plotly_chart(figures.cube_drill_figure(drill, breakdown, measure))
+st.dataframe(drill.rename(columns=CUBE_VALUES), hide_index=True)
+st.write("**20. Drill-down:** Location and cluster come from a lead's order, so leads without one are Unassigned; DM cost is split across locations and clusters by lead count.")
+st.markdown("---")
+
+if instrument.ENABLED:
+    INSTRUMENTS.record('streamlit_run', time.perf_counter() - run_start)
+
+with st.expander("Diagnostics"):
+    if not instrument.ENABLED:
+        st.caption("Instrumentation is off (DASHBOARD_INSTRUMENT=0).")
+    else:
+        st.caption("Pipeline stages for this server process. Cached stages only run on a cache miss; "
+                   "peak allocations need DASHBOARD_TRACEMALLOC=1.")
+        stages = INSTRUMENTS.snapshot()
+        st.dataframe(stages.rename(columns={'stage': 'Stage', **STAGE_FIELDS, 'mean_seconds': 'Mean s'}), hide_index=True)
+        # Arming the profiler and clearing caches affect every session, so
+        # they only show with DASHBOARD_PROFILING=1
+        if instrument.PROFILING:
+            profile_stage = st.selectbox("Profile the next run of", stages['stage'])
+            if st.button("Arm profiler") and profile_stage:
+                INSTRUMENTS.profile_next(profile_stage)
+            if st.button("Clear cached results for every session"):
+                st.cache_data.clear()
+                st.cache_resource.clear()
+        if instrument.PROFILING and INSTRUMENTS.profiles:
+            st.write(f"Latest profile: `{INSTRUMENTS.profiles[-1]}`")
+            st.code(profile_report(INSTRUMENTS.profiles[-1]))
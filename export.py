@@ -0,0 +1,173 @@
+import io
+import itertools
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.comments import Comment
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import PatternFill, Font, Border, Side
+from openpyxl.utils import get_column_letter
+
+from instrument import stage
+from loader import CACHE_DIR, call_log_columns, iter_call_log
+from metrics import REACH_OUT_ALL, REACH_OUT_CONNECTED, funnel_frame
+
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Excel's limits per worksheet
+MAX_SHEET_ROWS = 1_048_576
+MAX_SHEET_NAME = 31
+
+HEADER_FILL = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+THIN_BORDER = Border(left=Side(style='thin'),
+                     right=Side(style='thin'),
+                     top=Side(style='thin'),
+                     bottom=Side(style='thin'))
+
+RATIO_COMMENTS = {
+    'Cost per lead Ratio': "Cost per Lead = Total Costs / Leads",
+    'Cost /confirmed_order_Month_Wise_Ratio': "Cost per Confirmed Order = Total revenue generated in a particular month / Confirmed Orders",
+    'Leads to Calls Connected Ratio': "Leads to Calls Ratio = Connected Calls / Total Leads",
+    'Leads to validated Lead Ratio': "Validated Leads / Total Leads",
+    'Leads to Order Ratio': "Total Order Count / Total Leads",
+    'Roas': "Revenue / Advertising Spend (Total Costs, where total cost is equal to the call cost of all leads plus digital marketing costs per month.)",
+    REACH_OUT_ALL: "Mean days between lead creation and the first call",
+    REACH_OUT_CONNECTED: "Mean days between lead creation and the first connected call",
+    'Cost per validated lead': "Cost per validated Leads Ratio = Total count of validated leads / Total cost"
+}
+
+RATIO_NOTES = [
+    "Cost per Lead = Total Costs / Leads",
+    "Cost per Confirmed Order = Total revenue generated in a particular month / Confirmed Orders",
+    "Leads to Calls Ratio = Connected Calls / Total Leads",
+    "Validated Leads Ratio = Validated Leads / Total Leads",
+    "Leads to Order Ratio = Orders / Total Leads",
+    "Revenue / Advertising Spend (Total Costs, where total cost is equal to the call cost of all leads plus digital marketing costs per month.)",
+    "",
+    "Note: Validated lead data is not available for April month. (Validated data means when our telecaller team calls a lead and the lead expresses interest or requests more information.)"
+]
+
+
+def display_name(column):
+    return column.replace(' ', '_').replace('/', '_').replace('__', '_').strip()
+
+
+def display_columns(frame):
+    return frame.rename(columns=display_name)
+
+
+class SheetSpec:
+    # `rows` is a DataFrame, an iterable of DataFrame chunks or an iterable of row sequences
+    def __init__(self, name, columns, rows, comments=None, notes=None, total_label=None):
+        self.name = name
+        self.columns = list(columns)
+        self.rows = rows
+        self.comments = comments or {}
+        self.notes = notes or []
+        self.total_label = total_label
+
+
+def _frame_rows(frame):
+    values = frame.astype(object)
+    return values.where(frame.notna(), None).itertuples(index=False, name=None)
+
+
+def _iter_rows(rows):
+    if isinstance(rows, pd.DataFrame):
+        rows = [rows]
+    for chunk in rows:
+        if isinstance(chunk, pd.DataFrame):
+            yield from _frame_rows(chunk)
+        else:
+            yield chunk
+
+
+def _header_cells(worksheet, spec):
+    cells = []
+    for column in spec.columns:
+        cell = WriteOnlyCell(worksheet, value=column)
+        cell.fill = HEADER_FILL
+        comment = spec.comments.get(column)
+        if comment:
+            cell.comment = Comment(comment, "System")
+        cells.append(cell)
+    return cells
+
+
+def _sheet_name(name, part):
+    if part == 1:
+        return name[:MAX_SHEET_NAME]
+    suffix = f' ({part})'
+    return name[:MAX_SHEET_NAME - len(suffix)] + suffix
+
+
+def _format_table(worksheet, spec, row_count):
+    # Borders and the bold total row are range-level conditional formats,
+    # so the streamed body cells stay plain values with no per-cell styles.
+    table_range = f"A1:{get_column_letter(len(spec.columns))}{row_count}"
+    worksheet.conditional_formatting.add(table_range, FormulaRule(formula=['TRUE'], border=THIN_BORDER))
+    if spec.total_label is not None:
+        worksheet.conditional_formatting.add(table_range, FormulaRule(formula=[f'$A1="{spec.total_label}"'], font=Font(bold=True)))
+
+
+def write_sheet(workbook, spec, max_rows=MAX_SHEET_ROWS):
+    # Rows past a sheet's limit continue on "<name> (2)", "<name> (3)", ...,
+    # each with its own header and formats; the notes go after the last one
+    rows = _iter_rows(spec.rows)
+    capacity = max_rows - 1 - (len(spec.notes) + 1 if spec.notes else 0)
+    total = 0
+    for part in itertools.count(1):
+        worksheet = workbook.create_sheet(_sheet_name(spec.name, part))
+        worksheet.append(_header_cells(worksheet, spec))
+        row_count = 1
+        for row in itertools.islice(rows, capacity):
+            worksheet.append(row)
+            row_count += 1
+        _format_table(worksheet, spec, row_count)
+        total += row_count - 1
+        next_row = next(rows, None)
+        if next_row is None:
+            break
+        rows = itertools.chain([next_row], rows)
+
+    if spec.notes:
+        worksheet.append([])
+        for note in spec.notes:
+            worksheet.append([note])
+    return total
+
+
+def export_workbook(specs, target=None):
+    with stage('excel_export') as current:
+        workbook = Workbook(write_only=True)
+        current.rows = sum(write_sheet(workbook, spec) for spec in specs)
+        buffer = io.BytesIO() if target is None else None
+        workbook.save(buffer if target is None else target)
+    return buffer.getvalue() if target is None else target
+
+
+def ratio_sheet(rd_1, name='Lead Data'):
+    table = display_columns(rd_1)
+    comments = {display_name(column): text for column, text in RATIO_COMMENTS.items()}
+    return SheetSpec(name, table.columns, table, comments=comments, notes=RATIO_NOTES, total_label='Total')
+
+
+def funnel_sheet(funnel_data, name='Funnel'):
+    return SheetSpec(name, funnel_data.columns, funnel_data)
+
+
+def call_log_sheet(columns, chunks, name='Call Log'):
+    return SheetSpec(name, columns, chunks)
+
+
+def raw_log_sheet(call_log_path, cache_dir=CACHE_DIR):
+    return call_log_sheet(call_log_columns(call_log_path, cache_dir), iter_call_log(call_log_path, cache_dir=cache_dir))
+
+
+def lead_data_sheets(rd_1, funnel_vals, call_log_path=None, cache_dir=CACHE_DIR):
+    # The raw call log dominates the export time, so it is only written when
+    # a call log path is given
+    sheets = [ratio_sheet(rd_1), funnel_sheet(funnel_frame(funnel_vals))]
+    if call_log_path is not None:
+        sheets.append(raw_log_sheet(call_log_path, cache_dir))
+    return sheets
@@ -0,0 +1,230 @@
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+from cohort import COHORT_VALUES, cohort_pivot
+from cube import CUBE_VALUES, member_label
+from instrument import timed
+from latency import LATENCY_KINDS, PERCENTILES
+from metrics import funnel_frame
+from timeseries import SERIES
+
+RATIOS = ['Cost per lead Ratio', 'Cost /confirmed_order_Month_Wise_Ratio', 'Leads to Calls Connected Ratio', 'Leads to validated Lead Ratio', 'Leads to Order Ratio', 'Roas']
+
+COUNT_METRICS = [
+    ('Lead_Count/Month', 'blue', 'Lead Count'),
+    ('Phone_Call_Count/Month', 'orange', 'Phone Call Count'),
+    ('Validated_Lead_Count/Month', 'green', 'Validated Lead Count'),
+    ('Count _of_Orders _Deliverd /Month', 'purple', 'Orders Delivered')
+]
+
+
+def monthly_rows(rd_1):
+    return rd_1[rd_1['Lead Month'] != 'Total']
+
+
+def funnel_figure(funnel_vals):
+    return px.funnel(funnel_frame(funnel_vals), x='Count', y='Stage', title='Sales Funnel')
+
+
+def revenue_figure(rd_1):
+    return px.line(monthly_rows(rd_1), x='Lead Month', y='Revenue_generated/Month', title='Revenue Over Time', markers=True)
+
+
+def lead_counts_figure(rd_1):
+    return px.bar(monthly_rows(rd_1), x='Lead Month', y='Lead_Count/Month', title='Lead Counts Over Time', text='Lead_Count/Month')
+
+
+def grouped_bar_figure(rd_1):
+    return px.bar(rd_1, x='Lead Month', y=[metric for metric, _, _ in COUNT_METRICS], title='Lead Counts / Phone Calls / Validated Leads / Count of Orders Delivered', barmode='group')
+
+
+def dual_axis_figure(rd_1, title='Cost and Revenue by Lead Month'):
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=rd_1['Lead Month'], y=rd_1['Total_Cost(DM+Phone_Calls)'], name='Total Cost', marker_color='blue'))
+    fig.add_trace(go.Bar(x=rd_1['Lead Month'], y=rd_1['Revenue_generated/Month'], name='Revenue', marker_color='orange'))
+    fig.update_layout(title=title, barmode='group', yaxis_title='Total Cost', yaxis2=dict(title='Revenue', overlaying='y', side='right'))
+    return fig
+
+
+def orders_pie_figure(rd_1, title='Proportion of Orders Delivered by Lead Month'):
+    return px.pie(monthly_rows(rd_1), names='Lead Month', values='Count _of_Orders _Deliverd /Month', title=title)
+
+
+def ratio_figures(rd_1, title_suffix='Over Lead Months'):
+    filtered = monthly_rows(rd_1)
+    return [px.line(filtered, x='Lead Month', y=ratio, title=f'{ratio} {title_suffix}', markers=True) for ratio in RATIOS]
+
+
+def _trend_traces(filtered):
+    return [
+        go.Scatter(
+            x=filtered['Lead Month'],
+            y=filtered[metric].cumsum(),
+            mode='lines+markers',
+            name=f'{name} Trend',
+            line=dict(color=color, width=2, dash='dash')
+        )
+        for metric, color, name in COUNT_METRICS
+    ]
+
+
+def stacked_figure(rd_1, trendlines=False):
+    filtered = monthly_rows(rd_1)
+    fig = go.Figure()
+    for metric, color, name in COUNT_METRICS:
+        fig.add_trace(go.Bar(
+            x=filtered['Lead Month'],
+            y=filtered[metric],
+            name=name,
+            marker_color=color,
+            text=filtered[metric],
+            textposition='auto'
+        ))
+    if trendlines:
+        fig.add_traces(_trend_traces(filtered))
+
+    fig.update_layout(
+        title='Monthly Metrics Overview: Leads and Orders',
+        barmode='stack',
+        xaxis_title='Lead Month',
+        yaxis_title='Count',
+        legend_title='Metrics'
+    )
+    return fig
+
+
+def revenue_cost_figure(rd_1):
+    filtered = monthly_rows(rd_1)
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=filtered['Lead Month'], y=filtered['Revenue_generated/Month'], name='Revenue Generated', marker_color='lightblue'))
+    fig.add_trace(go.Bar(x=filtered['Lead Month'], y=filtered['Total_Cost(DM+Phone_Calls)'], name='Total Cost', marker_color='lightcoral'))
+    fig.update_layout(title='Revenue Generated vs. Total Cost', barmode='group', xaxis_title='Lead Month', yaxis_title='Amount', legend_title='Metrics')
+    return fig
+
+
+def trend_figure(rd_1):
+    fig = go.Figure(_trend_traces(monthly_rows(rd_1)))
+    fig.update_layout(
+        title='Trend Lines Overview: Leads and Orders',
+        xaxis_title='Month',
+        yaxis_title='Count',
+        legend_title='Metrics',
+        template='plotly'
+    )
+    return fig
+
+
+def _hours(seconds):
+    return seconds / 3600
+
+
+def latency_histogram_figure(sketches, bins=40):
+    # Binned from the digest centroids, so the raw responses are not needed
+    fig = go.Figure()
+    digests = {kind: sketches.digest(kind) for kind in LATENCY_KINDS}
+    upper = max([_hours(digest.quantile(0.99)) for digest in digests.values() if digest.count] or [1])
+    for kind, name in LATENCY_KINDS.items():
+        counts, edges = np.histogram(_hours(digests[kind].means), bins=bins, range=(0, upper), weights=digests[kind].weights)
+        fig.add_trace(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=edges[1] - edges[0], name=name, opacity=0.6))
+    fig.update_layout(title='First Response Time Distribution (up to p99)', barmode='overlay', xaxis_title='Hours after lead creation', yaxis_title='Leads')
+    return fig
+
+
+def latency_trend_figure(sketches):
+    fig = go.Figure()
+    for kind, name in LATENCY_KINDS.items():
+        table = sketches.percentiles(kind)
+        for p in PERCENTILES:
+            fig.add_trace(go.Scatter(x=table['month'], y=_hours(table[f'p{p}']), mode='lines+markers', name=f'{name} p{p}',
+                                     line=dict(dash='solid' if kind == 'first_response' else 'dash')))
+    fig.update_layout(title='First Response Time Percentiles by Lead Month', xaxis_title='Lead Month', yaxis_title='Hours', legend_title='Percentile')
+    return fig
+
+
+def latency_cluster_figure(sketches, kind='first_response'):
+    table = sketches.percentiles(kind, by='cluster')
+    fig = go.Figure([go.Bar(x=table['cluster'], y=_hours(table[f'p{p}']), name=f'p{p}') for p in PERCENTILES])
+    fig.update_layout(title=f'{LATENCY_KINDS[kind]} Response Time Percentiles by Cluster', barmode='group', xaxis_title='Cluster', yaxis_title='Hours')
+    return fig
+
+
+@timed('latency_figures')
+def latency_figures(sketches):
+    return {
+        'latency_histogram': latency_histogram_figure(sketches),
+        'latency_trend': latency_trend_figure(sketches),
+        'latency_cluster': latency_cluster_figure(sketches),
+    }
+
+
+@timed('cohort_figure')
+def cohort_heatmap_figure(matrix, value='orders'):
+    fig = px.imshow(cohort_pivot(matrix, value), text_auto='.0f', color_continuous_scale='Blues', aspect='auto',
+                    labels=dict(x='Conversion Month', y='Lead Month', color=COHORT_VALUES[value]))
+    fig.update_layout(title=f'{COHORT_VALUES[value]} by Lead Month and Conversion Month')
+    return fig
+
+
+@timed('timeseries_figure')
+def timeseries_figure(series, values, granularity, total):
+    # WebGL keeps rendering flat; the server already bounds the point count
+    fig = go.Figure(go.Scattergl(x=values.index, y=values.to_numpy(), mode='lines+markers' if granularity == 'call' else 'lines',
+                                 name=SERIES[series], marker=dict(size=3)))
+    fig.update_layout(title=f'{SERIES[series]} per {granularity} ({len(values):,} of {total:,} points)',
+                      xaxis_title='Call time', yaxis_title=SERIES[series], uirevision='timeseries')
+    return fig
+
+
+@timed('cube_figure')
+def cube_drill_figure(rows, dimension, measure):
+    x = [member_label(dimension, member) for member in rows[dimension]]
+    fig = go.Figure(go.Bar(x=x, y=rows[measure], text=rows[measure].round(3), textposition='auto', name=CUBE_VALUES[measure]))
+    fig.update_layout(title=f'{CUBE_VALUES[measure]} by {dimension.title()}', xaxis_title=dimension.title(), yaxis_title=CUBE_VALUES[measure])
+    return fig
+
+
+# First selection of the interactive panels in both apps and in the precomputed artifacts
+COHORT_DEFAULT = 'orders'
+TIMESERIES_DEFAULT = 'calls'
+CUBE_DEFAULT_BREAKDOWN = 'location'
+CUBE_DEFAULT_MEASURE = 'leads'
+
+# Graph id -> builder for the Dash app's monthly charts, in layout order
+DASH_MONTHLY_GRAPHS = [
+    ('revenue-graph', revenue_figure),
+    ('lead-counts-graph', lead_counts_figure),
+    ('grouped-bar-graph', grouped_bar_figure),
+    ('dual-axis-graph', lambda rd_1: dual_axis_figure(rd_1, title='Cost and Revenue by Month')),
+    ('pie-graph', lambda rd_1: orders_pie_figure(rd_1, title='Proportion of Orders Delivered by Month')),
+    ('stacked-graph', lambda rd_1: stacked_figure(rd_1, trendlines=True)),
+    ('revenue-cost-graph', revenue_cost_figure),
+]
+DASH_LATENCY_GRAPHS = ['latency-histogram-graph', 'latency-trend-graph', 'latency-cluster-graph']
+DASH_RATIO_GRAPHS = ['cost-per-lead-graph', 'cost-per-confirmed-order-graph', 'leads-to-calls-graph', 'leads-to-validated-graph', 'leads-to-order-graph', 'roas-graph']
+
+
+def dash_ratio_figures(rd_1):
+    return ratio_figures(rd_1, title_suffix='Over Months')
+
+
+@timed('dash_figures')
+def dash_figures(funnel_vals, rd_1):
+    figs = {'funnel-graph': funnel_figure(funnel_vals)}
+    figs.update((graph_id, build(rd_1)) for graph_id, build in DASH_MONTHLY_GRAPHS)
+    figs.update(zip(DASH_RATIO_GRAPHS, dash_ratio_figures(rd_1)))
+    return figs
+
+
+@timed('streamlit_figures')
+def streamlit_figures(funnel_vals, rd_1):
+    return {
+        'funnel': funnel_figure(funnel_vals),
+        'revenue': revenue_figure(rd_1),
+        'lead_counts': lead_counts_figure(rd_1),
+        'grouped_bar': grouped_bar_figure(rd_1),
+        'dual_axis': dual_axis_figure(rd_1),
+        'pie': orders_pie_figure(rd_1),
+        'ratios': ratio_figures(rd_1),
+        'trend': trend_figure(rd_1),
+    }
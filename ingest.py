@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from loader import CACHE_DIR, file_hash, read_call_log_csv
+from metrics import (
+    FUNNEL_LABELS, PHONE_PARTIAL_AGGREGATES, base_from_partials, derive_ratio_table, funnel_from_partials,
+    load_monthly_inputs, merge_phone_partials, order_partials, phone_partials,
+)
+
+STATE_DIR = os.path.join(CACHE_DIR, 'ingest')
+
+EXACT = 'exact'
+HLL = 'hll'
+PART_KINDS = ('phones', 'orders', 'totals')
+
+
+def _hash64(values):
+    # splitmix64 finalizer, vectorized over uint64
+    with np.errstate(over='ignore'):
+        x = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def _leading_zeros(words):
+    zeros = np.zeros(len(words), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        top_clear = words < (np.uint64(1) << np.uint64(64 - shift))
+        zeros[top_clear] += shift
+        words = np.where(top_clear, words << np.uint64(shift), words)
+    zeros += (words >> np.uint64(63)) == 0
+    return zeros
+
+
+class HyperLogLog:
+    def __init__(self, precision=14, registers=None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def add(self, values):
+        hashed = _hash64(np.asarray(values, dtype=np.int64))
+        index = (hashed >> np.uint64(64 - self.precision)).astype(np.int64)
+        rank = np.minimum(_leading_zeros(hashed << np.uint64(self.precision)) + 1, 64 - self.precision + 1)
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+        return self
+
+    def merge(self, other):
+        return HyperLogLog(self.precision, np.maximum(self.registers, other.registers))
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        empty = int(np.sum(self.registers == 0))
+        if estimate <= 2.5 * m and empty:
+            estimate = m * np.log(m / empty)
+        return int(round(estimate))
+
+
+# Partial aggregates of every ingested batch. Each batch appends its own part
+# (phones, orders and, with HLL, month totals) and never touches earlier
+# ones, so a batch costs the same however much history there is; reads merge
+# the parts with the same sum/min/any rules, and compact() folds them back
+# into one. The manifest swap alone publishes a part: a crash part-way leaves
+# the previous state intact, and the retry starts from it.
+class IngestState:
+    def __init__(self, state_dir=STATE_DIR, mode=EXACT):
+        self.state_dir = state_dir
+        self.manifest_path = os.path.join(state_dir, 'manifest.json')
+        for kind in PART_KINDS:
+            os.makedirs(self._path(kind), exist_ok=True)
+        self.manifest = self._load_manifest(mode)
+        self.mode = self.manifest['mode']
+
+    def _path(self, *parts):
+        return os.path.join(self.state_dir, *parts)
+
+    def _load_manifest(self, mode):
+        if not os.path.exists(self.manifest_path):
+            # Batches are keyed by content hash; file names are only for reference
+            return {'mode': mode, 'parts': [], 'batches': {}}
+        with open(self.manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest['mode'] != mode:
+            raise ValueError(f"{self.state_dir} holds {manifest['mode']} partials, not {mode}")
+        return manifest
+
+    def _save_manifest(self):
+        tmp_path = f'{self.manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def _write_parquet(frame, path):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def _read_parts(self, kind):
+        return [pd.read_parquet(self._path(kind, f'{stem}.parquet')) for stem in self.manifest['parts']]
+
+    def _read_sketches(self, stem):
+        with np.load(self._path('totals', f'{stem}.npz')) as registers:
+            return {month: HyperLogLog(registers=registers[month]) for month in registers.files}
+
+    def _write_part(self, stem, phones, orders, totals=None, sketches=None):
+        # Months are stored as their first day: Parquet has no Period type
+        self._write_parquet(phones.assign(month=phones['month'].dt.to_timestamp()), self._path('phones', f'{stem}.parquet'))
+        self._write_parquet(orders.assign(month=orders['month'].dt.to_timestamp()), self._path('orders', f'{stem}.parquet'))
+        if totals is not None:
+            self._write_parquet(totals, self._path('totals', f'{stem}.parquet'))
+            sketch_path = self._path('totals', f'{stem}.npz')
+            np.savez(f'{sketch_path}.{os.getpid()}.tmp.npz', **{month: sketch.registers for month, sketch in sketches.items()})
+            os.replace(f'{sketch_path}.{os.getpid()}.tmp.npz', sketch_path)
+
+    def _publish(self, parts, digest=None, path=None):
+        self.manifest['parts'] = parts
+        if digest is not None:
+            self.manifest['batches'][digest] = path
+        self._save_manifest()
+        self._remove_unreferenced()
+
+    def _remove_unreferenced(self):
+        # Compacted parts, and leftovers of a batch that crashed
+        kept = set(self.manifest['parts'])
+        for kind in PART_KINDS:
+            for name in os.listdir(self._path(kind)):
+                if name.split('.', 1)[0] not in kept:
+                    os.remove(self._path(kind, name))
+
+    def ingest(self, path):
+        digest = file_hash(path)
+        if digest in self.manifest['batches']:
+            return False
+
+        data = read_call_log_csv(path)
+        stem = digest[:16]
+        phones = phone_partials(data)
+        totals = sketches = None
+        if self.mode == HLL:
+            # HLL mode keeps the full lead population only as month-level totals
+            by_month = phones.groupby(phones['month'].astype(str), sort=False)
+            totals = pd.DataFrame({
+                'price_cents': by_month['price_cents'].sum(),
+                'first_response_sum': by_month['first_response'].sum(),
+                'first_response_count': by_month['first_response'].count(),
+            }).rename_axis('month').reset_index()
+            sketches = {month: HyperLogLog().add(month_phones.to_numpy()) for month, month_phones in by_month['phone']}
+            phones = phones[(phones['connected_calls'] > 0) | phones['delivered']]
+        self._write_part(stem, phones, order_partials(data), totals, sketches)
+        self._publish(self.manifest['parts'] + [stem], digest, path)
+        return True
+
+    def compact(self):
+        # Folds every part into one; reads get cheaper, results stay the same
+        parts = self.manifest['parts']
+        if len(parts) < 2:
+            return False
+        stem = f'compact-{parts[-1]}'
+        totals = sketches = None
+        if self.mode == HLL:
+            totals = pd.concat(self._read_parts('totals'), ignore_index=True).groupby('month', sort=False).sum().reset_index()
+            sketches = self._sketches()
+        self._write_part(stem, self.phones(), self.orders(), totals, sketches)
+        self._publish([stem])
+        return True
+
+    def phones(self):
+        parts = self._read_parts('phones')
+        if not parts:
+            return pd.DataFrame(columns=['month', 'phone', *PHONE_PARTIAL_AGGREGATES])
+        phones = merge_phone_partials(pd.concat(parts, ignore_index=True))
+        phones['month'] = phones['month'].dt.to_period('M')
+        return phones
+
+    def orders(self):
+        parts = self._read_parts('orders')
+        if not parts:
+            return pd.DataFrame({'order_id': [], 'month': pd.PeriodIndex([], freq='M'), 'cost_cents': []})
+        # Parts are in ingest order, so the first batch that saw an order
+        # keeps it, like drop_duplicates on the full log
+        orders = pd.concat(parts, ignore_index=True).drop_duplicates('order_id', ignore_index=True)
+        orders['month'] = orders['month'].dt.to_period('M')
+        return orders
+
+    def _sketches(self):
+        merged = {}
+        for stem in self.manifest['parts']:
+            for month, sketch in self._read_sketches(stem).items():
+                merged[month] = merged[month].merge(sketch) if month in merged else sketch
+        return merged
+
+    def monthly_base(self):
+        base = base_from_partials(self.phones(), self.orders())
+        if self.mode == HLL and self.manifest['parts']:
+            totals = pd.concat(self._read_parts('totals'), ignore_index=True).groupby('month').sum()
+            for month, sketch in self._sketches().items():
+                period = pd.Period(month, 'M')
+                base.loc[period, 'leads'] = sketch.count()
+                base.loc[period, 'phone_cost'] = totals.loc[month, 'price_cents'] / 100
+                base.loc[period, 'reach_days_all'] = totals.loc[month, 'first_response_sum'] / 86400
+                base.loc[period, 'reach_count_all'] = totals.loc[month, 'first_response_count']
+            base = base.fillna(0).sort_index()
+        return base
+
+    def funnel(self):
+        funnel_vals = funnel_from_partials(self.phones())
+        if self.mode == HLL:
+            merged = HyperLogLog()
+            for sketch in self._sketches().values():
+                merged = merged.merge(sketch)
+            funnel_vals[0] = merged.count()
+        return funnel_vals
+
+    def ratio_table(self, inputs):
+        return derive_ratio_table(self.monthly_base(), inputs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ingest call-log batches into per-month partial aggregates.')
+    parser.add_argument('batches', nargs='*', help='call-log CSV batches with the anew_2 (3).csv schema')
+    parser.add_argument('--state-dir', default=STATE_DIR)
+    parser.add_argument('--hll', action='store_true', help='approximate lead counts with HyperLogLog sketches')
+    parser.add_argument('--table', help='write the monthly ratio table to this CSV')
+    parser.add_argument('--compact', action='store_true', help='fold every ingested part into one after ingesting')
+    args = parser.parse_args()
+
+    state = IngestState(args.state_dir, HLL if args.hll else EXACT)
+    for batch in args.batches:
+        print(f"{batch}: {'ingested' if state.ingest(batch) else 'already ingested'}")
+    if args.compact and state.compact():
+        print('compacted')
+    print(dict(zip(FUNNEL_LABELS, state.funnel())))
+    if args.table:
+        state.ratio_table(load_monthly_inputs()).to_csv(args.table, index=False)
@@ -0,0 +1,245 @@
+import cProfile
+import functools
+import itertools
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+# Timings and row counts cost about a microsecond per stage, so they stay on
+# unless DASHBOARD_INSTRUMENT=0; tracemalloc slows every allocation and is
+# only started when asked for
+ENABLED = os.environ.get('DASHBOARD_INSTRUMENT', '1') != '0'
+# Stages reset the tracemalloc peak, so they leave it alone unless asked,
+# e.g. when the benchmark suite is tracing for its own peaks
+TRACE_PEAKS = ENABLED and os.environ.get('DASHBOARD_TRACEMALLOC') == '1'
+if TRACE_PEAKS and not tracemalloc.is_tracing():
+    tracemalloc.start()
+# Arming the profiler slows a stage for whoever hits it next and writes to
+# disk, so the controls for it are off unless DASHBOARD_PROFILING=1
+PROFILING = ENABLED and os.environ.get('DASHBOARD_PROFILING') == '1'
+PROFILE_DIR = os.environ.get('DASHBOARD_PROFILE_DIR', os.path.join('.cache', 'profiles'))
+MAX_PROFILES = 20
+
+STAGE_FIELDS = {
+    'calls': 'Calls',
+    'errors': 'Errors',
+    'seconds': 'Total s',
+    'last_seconds': 'Last s',
+    'max_seconds': 'Max s',
+    'rows': 'Rows',
+    'last_rows': 'Last rows',
+    'peak_bytes': 'Last peak bytes',
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Instruments:
+    # Process-wide stage and cache statistics. Every Streamlit session and
+    # Dash thread in a process shares one set; tracemalloc peaks are process
+    # wide too, so overlapping stages in other threads show up in each other.
+    def __init__(self):
+        self.stages = {}
+        self.caches = {}
+        self.armed = set()
+        self.profiles = []
+        self._profile_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def record(self, name, seconds, rows=None, peak_bytes=None, failed=False):
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = dict.fromkeys(STAGE_FIELDS, 0)
+                stats.update(rows=None, last_rows=None, peak_bytes=None)
+            stats['calls'] += 1
+            stats['errors'] += failed
+            stats['seconds'] += seconds
+            stats['last_seconds'] = seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            if rows is not None:
+                stats['rows'] = (stats['rows'] or 0) + rows
+                stats['last_rows'] = rows
+            if peak_bytes is not None:
+                stats['peak_bytes'] = peak_bytes
+
+    def register_cache(self, name, cache):
+        # Anything with LRUCache's stats(); re-registering a name replaces it
+        self.caches[name] = cache
+
+    def profile_next(self, name):
+        # The next run of the stage, in whichever thread, is profiled and
+        # dumped; only stages that have already run can be armed
+        with self._lock:
+            if name not in self.stages:
+                return False
+            self.armed.add(name)
+        return True
+
+    def _take_profile(self, name):
+        if name not in self.armed:
+            return None
+        with self._lock:
+            if name not in self.armed:
+                return None
+            self.armed.discard(name)
+        return cProfile.Profile()
+
+    def _save_profile(self, name, profile):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        # Workers share the directory and a stage can be dumped twice a second
+        stamp = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{next(self._profile_ids)}'
+        path = os.path.join(PROFILE_DIR, f'{name.replace("/", "_")}-{stamp}.prof')
+        profile.dump_stats(path)
+        with self._lock:
+            self.profiles.append(path)
+            dropped, self.profiles = self.profiles[:-MAX_PROFILES], self.profiles[-MAX_PROFILES:]
+        for old_path in dropped:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+
+    def snapshot(self):
+        with self._lock:
+            rows = [{'stage': name, **stats} for name, stats in self.stages.items()]
+        frame = pd.DataFrame(rows, columns=['stage', *STAGE_FIELDS])
+        frame['mean_seconds'] = frame['seconds'] / frame['calls']
+        return frame.sort_values('seconds', ascending=False, ignore_index=True)
+
+    def prometheus(self):
+        # Prometheus text exposition format, version 0.0.4. Each gunicorn worker
+        # answers for itself, so every sample carries its pid; sum without
+        # (pid) to see the whole server
+        process = f'pid="{os.getpid()}"'
+        with self._lock:
+            stages = {name: dict(stats) for name, stats in self.stages.items()}
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} {kind}'])
+            lines.extend(f'{name}{{{labels}}} {value}' for labels, value in samples)
+
+        stage_samples = lambda field: [(f'{process},stage="{_escape(name)}"', stats[field]) for name, stats in stages.items()
+                                       if stats[field] is not None]
+        lines.extend(['# HELP dashboard_stage_seconds Wall time spent in a pipeline stage.',
+                      '# TYPE dashboard_stage_seconds summary'])
+        for labels, value in stage_samples('seconds'):
+            lines.append(f'dashboard_stage_seconds_sum{{{labels}}} {value}')
+        for labels, value in stage_samples('calls'):
+            lines.append(f'dashboard_stage_seconds_count{{{labels}}} {value}')
+        metric('dashboard_stage_last_seconds', 'gauge', 'Wall time of the latest run of a stage.', stage_samples('last_seconds'))
+        metric('dashboard_stage_max_seconds', 'gauge', 'Slowest run of a stage.', stage_samples('max_seconds'))
+        metric('dashboard_stage_errors_total', 'counter', 'Stage runs that raised.', stage_samples('errors'))
+        metric('dashboard_stage_rows_total', 'counter', 'Rows processed by a stage.', stage_samples('rows'))
+        metric('dashboard_stage_peak_bytes', 'gauge', 'Peak traced allocation of the latest run (tracemalloc only).', stage_samples('peak_bytes'))
+
+        caches = {name: cache.stats() for name, cache in self.caches.items()}
+        for field, kind, help_text in [('hits', 'counter', 'Cache hits.'), ('misses', 'counter', 'Cache misses.'),
+                                       ('evictions', 'counter', 'Cache evictions.'), ('size', 'gauge', 'Cached entries.')]:
+            name = f'dashboard_cache_{field}' + ('_total' if kind == 'counter' else '')
+            metric(name, kind, help_text, [(f'{process},cache="{_escape(cache)}"', stats[field]) for cache, stats in caches.items()])
+        return '\n'.join(lines) + '\n'
+
+
+INSTRUMENTS = Instruments()
+
+
+def profile_report(path, limit=25):
+    report = io.StringIO()
+    pstats.Stats(path, stream=report).sort_stats('cumulative').print_stats(limit)
+    return report.getvalue()
+
+
+class Stage:
+    __slots__ = ('name', 'rows', 'start', 'profile')
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.profile = INSTRUMENTS._take_profile(self.name) if INSTRUMENTS.armed else None
+        if TRACE_PEAKS and tracemalloc.is_tracing():
+            # Nested stages each get their own peak; an inner stage's peak is
+            # folded into its parent's before the tracemalloc peak is reset
+            frames = INSTRUMENTS._local.__dict__.setdefault('frames', [])
+            current, peak = tracemalloc.get_traced_memory()
+            if frames:
+                frames[-1][1] = max(frames[-1][1], peak)
+            tracemalloc.reset_peak()
+            frames.append([current, current])
+        if self.profile is not None:
+            self.profile.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        seconds = time.perf_counter() - self.start
+        if self.profile is not None:
+            self.profile.disable()
+            INSTRUMENTS._save_profile(self.name, self.profile)
+        peak_bytes = None
+        frames = INSTRUMENTS._local.__dict__.get('frames')
+        if frames and TRACE_PEAKS and tracemalloc.is_tracing():
+            start, peak = frames.pop()
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            if frames:
+                frames[-1][1] = max(frames[-1][1], peak)
+            tracemalloc.reset_peak()
+            peak_bytes = peak - start
+        INSTRUMENTS.record(self.name, seconds, self.rows, peak_bytes, exc_type is not None)
+        return False
+
+
+class _NullStage:
+    __slots__ = ('rows',)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+def stage(name, rows=None):
+    return Stage(name, rows) if ENABLED else NULL_STAGE
+
+
+def _frame_rows(values):
+    for value in values:
+        if isinstance(value, pd.DataFrame):
+            return len(value)
+    return None
+
+
+def timed(name):
+    # Rows are those of the first DataFrame argument, else of a DataFrame
+    # result; with instrumentation off the function is returned untouched
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Stage(name) as current:
+                result = function(*args, **kwargs)
+                current.rows = _frame_rows(args) or _frame_rows(result if isinstance(result, tuple) else (result,))
+            return result
+        return wrapper
+    return decorate
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+from instrument import timed
+from metrics import month_label, to_month
+
+LATENCY_COLUMNS = ['Phone Number', 'Created Date', 'ConversationDuration', 'Response in Sec', 'Cluster name']
+LATENCY_KINDS = {'first_response': 'First call', 'first_connected_response': 'First connected call'}
+PERCENTILES = [50, 90, 99]
+UNASSIGNED_CLUSTER = 'Unassigned'
+
+
+class TDigest:
+    # Merging t-digest: centroids sorted by mean, each spanning at most one
+    # unit of the arcsine scale function, so the tails stay close to exact
+    # while the middle is coarse, however many digests are merged.
+    def __init__(self, compression=400, means=None, weights=None, min_value=np.inf, max_value=-np.inf):
+        self.compression = compression
+        self.means = np.empty(0) if means is None else means
+        self.weights = np.empty(0) if weights is None else weights
+        self.min = min_value
+        self.max = max_value
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def _k(self, q):
+        return self.compression / (2 * np.pi) * np.arcsin(2 * np.clip(q, 0, 1) - 1)
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        if not total:
+            return np.empty(0), np.empty(0)
+        cumulative = np.cumsum(weights)
+        k_left, k_right = self._k((cumulative - weights) / total), self._k(cumulative / total)
+        # Greedy merge: a centroid takes neighbours while its own left and right
+        # edges stay within one unit of k. k_right is monotone, so every
+        # possible start's end is one searchsorted and the loop only follows
+        # the chain, once per output centroid.
+        ends = np.maximum(np.searchsorted(k_right, k_left + 1, side='right'), np.arange(1, len(means) + 1))
+        starts = []
+        start = 0
+        while start < len(ends):
+            starts.append(start)
+            start = int(ends[start])
+        bucket_weights = np.add.reduceat(weights, starts)
+        return np.add.reduceat(weights * means, starts) / bucket_weights, bucket_weights
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.means, self.weights = self._compress(np.concatenate([self.means, values]),
+                                                      np.concatenate([self.weights, np.ones(len(values))]))
+            self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+        return self
+
+    def merge(self, other):
+        means, weights = self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+        return TDigest(self.compression, means, weights, min(self.min, other.min), max(self.max, other.max))
+
+    def quantile(self, q):
+        if not len(self.weights):
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        # Positions follow pandas' linear interpolation, so unmerged centroids are exact
+        return np.interp(np.asarray(q) * (total - 1) + 0.5, np.concatenate([[0], centers, [total]]),
+                         np.concatenate([[self.min], self.means, [self.max]]))
+
+
+def first_responses(data):
+    connected = data['ConversationDuration'] > 0
+    # Negative responses are calls logged before the lead was created
+    response = data['Response in Sec'].where(data['Response in Sec'] >= 0)
+    calls = pd.DataFrame({
+        'month': to_month(data['Created Date']),
+        'phone': data['Phone Number'],
+        'cluster': data['Cluster name'].astype(object),
+        'first_response': response,
+        'first_connected_response': response.where(connected),
+    })
+    firsts = calls.groupby(['month', 'phone'], sort=False).agg(
+        {'cluster': 'first', 'first_response': 'min', 'first_connected_response': 'min'}).reset_index()
+    firsts['cluster'] = firsts['cluster'].fillna(UNASSIGNED_CLUSTER)
+    return firsts
+
+
+# One digest per (kind, lead month, cluster). Months and clusters hold
+# disjoint phones, so any roll-up is a merge of digests, never a rescan.
+class LatencySketches:
+    def __init__(self, compression=400):
+        self.compression = compression
+        self.digests = {}
+
+    def update(self, data):
+        # A batch must carry every call of the phones it covers for its months,
+        # as a monthly export does; otherwise a phone's first response is split
+        firsts = first_responses(data)
+        for kind in LATENCY_KINDS:
+            for (month, cluster), responses in firsts.dropna(subset=[kind]).groupby(['month', 'cluster'])[kind]:
+                key = (kind, month, cluster)
+                if key not in self.digests:
+                    self.digests[key] = TDigest(self.compression)
+                self.digests[key].add(responses.to_numpy())
+        return self
+
+    def merge(self, other):
+        merged = LatencySketches(self.compression)
+        for sketches in (self, other):
+            for key, digest in sketches.digests.items():
+                merged.digests[key] = merged.digests.get(key, TDigest(self.compression)).merge(digest)
+        return merged
+
+    def months(self):
+        return sorted({month for _, month, _ in self.digests})
+
+    def clusters(self):
+        return sorted({cluster for _, _, cluster in self.digests})
+
+    def digest(self, kind, months=None, clusters=None):
+        merged = TDigest(self.compression)
+        for (digest_kind, month, cluster), digest in self.digests.items():
+            if digest_kind == kind and (months is None or month in months) and (clusters is None or cluster in clusters):
+                merged = merged.merge(digest)
+        return merged
+
+    def percentiles(self, kind, by='month'):
+        groups = self.months() if by == 'month' else self.clusters()
+        rows = []
+        for group in groups:
+            digest = self.digest(kind, months=[group]) if by == 'month' else self.digest(kind, clusters=[group])
+            row = {by: month_label(group) if by == 'month' else group, 'count': int(digest.count)}
+            row.update((f'p{p}', digest.quantile(p / 100)) for p in PERCENTILES)
+            rows.append(row)
+        return pd.DataFrame(rows, columns=[by, 'count', *[f'p{p}' for p in PERCENTILES]])
+
+
+@timed('latency')
+def compute_latency(data, compression=400):
+    return LatencySketches(compression).update(data)
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from instrument import timed
+
+CACHE_DIR = '.cache'
+SHARED_POINTER = 'current.json'
+MAP_ATTEMPTS = 3
+
+DATE_COLUMNS = ['Created Date', 'Start Date (Formatted)', 'Date']
+CATEGORY_COLUMNS = ['Lead Month', 'Location', 'Cluster name', 'Aggregate', 'Feed back', 'Name_x', 'Quantity']
+
+CSV_DTYPES = {
+    'Phone Number': 'int64',
+    'Created Time Only': 'string[pyarrow]',
+    'Start Time': 'string[pyarrow]',
+    'Time': 'string[pyarrow]',
+    'Order id': 'string[pyarrow]',
+    'Delivered': 'string[pyarrow]',
+    **{column: 'category' for column in CATEGORY_COLUMNS},
+}
+
+# Keep text columns Arrow-backed on the way back in instead of Python objects
+ARROW_TYPES = {pa.string(): pd.StringDtype('pyarrow'), pa.large_string(): pd.StringDtype('pyarrow')}
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_paths(path, cache_dir):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, stem + '.parquet'), os.path.join(cache_dir, stem + '.json')
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as meta_file:
+            return json.load(meta_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(meta_path, meta):
+    # Per-process tmp names: concurrent rebuilds must not replace each other's half-written files
+    tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as meta_file:
+        json.dump(meta, meta_file)
+    os.replace(tmp_path, meta_path)
+
+
+@timed('csv_parse')
+def read_call_log_csv(path, **kwargs):
+    data = pd.read_csv(path, dtype=CSV_DTYPES, **kwargs)
+    return convert_call_log(data)
+
+
+def convert_call_log(data):
+    for column in DATE_COLUMNS:
+        if column in data:
+            data[column] = pd.to_datetime(data[column], format='%d/%m/%Y')
+    if 'Delivered' in data:
+        data['Delivered'] = data['Delivered'].eq('Y').fillna(False).astype(bool)
+    return data
+
+
+@timed('cache_build')
+def build_cache(path, cache_dir=CACHE_DIR):
+    parquet_path, meta_path = _cache_paths(path, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    stat = os.stat(path)
+    digest = file_hash(path)
+    data = read_call_log_csv(path)
+    tmp_path = f'{parquet_path}.{os.getpid()}.tmp'
+    data.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, parquet_path)
+    _write_json(meta_path, {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest})
+    return parquet_path
+
+
+def fresh_cache(path, cache_dir=CACHE_DIR):
+    # The cache's path when it matches the CSV, else None; never parses the CSV
+    parquet_path, meta_path = _cache_paths(path, cache_dir)
+    meta = _read_meta(meta_path)
+    if meta is None or not os.path.exists(parquet_path):
+        return None
+    stat = os.stat(path)
+    if meta['mtime_ns'] == stat.st_mtime_ns and meta['size'] == stat.st_size:
+        return parquet_path
+    # The file was touched; it is only stale when its content actually changed
+    if meta['size'] == stat.st_size and meta['sha256'] == file_hash(path):
+        meta['mtime_ns'] = stat.st_mtime_ns
+        _write_json(meta_path, meta)
+        return parquet_path
+    return None
+
+
+def ensure_cache(path, cache_dir=CACHE_DIR):
+    return fresh_cache(path, cache_dir) or build_cache(path, cache_dir)
+
+
+def stat_fingerprint(path):
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def fingerprint(path, cache_dir=CACHE_DIR):
+    ensure_cache(path, cache_dir)
+    return _read_meta(_cache_paths(path, cache_dir)[1])['sha256']
+
+
+@timed('cache_load')
+def load_call_log(path, columns=None, cache_dir=CACHE_DIR):
+    table = pq.read_table(ensure_cache(path, cache_dir), columns=columns)
+    return table.to_pandas(types_mapper=ARROW_TYPES.get)
+
+
+def call_log_columns(path, cache_dir=CACHE_DIR):
+    return pq.read_schema(ensure_cache(path, cache_dir)).names
+
+
+def _shareable(column):
+    # Nulls become NaN/NaT values so pandas can wrap the mapped buffers
+    # instead of copying them to apply a validity mask
+    if pa.types.is_floating(column.type):
+        return pc.fill_null(column, np.nan)
+    if pa.types.is_timestamp(column.type):
+        return pc.fill_null(column.cast(pa.int64()), np.iinfo(np.int64).min).cast(column.type)
+    return column
+
+
+def _shared_dir(path, cache_dir):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, 'shared', stem)
+
+
+@timed('shared_publish')
+def publish_shared(path, cache_dir=CACHE_DIR):
+    # One uncompressed Arrow IPC file per call-log hash, named by
+    # current.json; swapping the pointer is what publishes a refresh
+    digest = fingerprint(path, cache_dir)
+    shared_dir = _shared_dir(path, cache_dir)
+    name = digest + '.arrow'
+    shared_path = os.path.join(shared_dir, name)
+    if not os.path.exists(shared_path):
+        os.makedirs(shared_dir, exist_ok=True)
+        # A single chunk per column too: pandas copies to stitch chunks together
+        table = pq.read_table(_cache_paths(path, cache_dir)[0]).combine_chunks()
+        table = pa.Table.from_arrays([_shareable(column) for column in table.columns], schema=table.schema)
+        tmp_path = f'{shared_path}.{os.getpid()}.tmp'
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, shared_path)
+    # The file being replaced stays for one more generation, so a reader that
+    # read the old pointer just before the swap can still map it
+    current = _read_meta(os.path.join(shared_dir, SHARED_POINTER)) or {}
+    previous = current.get('previous') if current.get('file') == name else current.get('file')
+    _write_json(os.path.join(shared_dir, SHARED_POINTER), {'sha256': digest, 'file': name, 'previous': previous})
+    for entry in os.listdir(shared_dir):
+        if entry.endswith('.arrow') and entry not in (name, previous):
+            # Processes still mapping an old file keep it until they re-map
+            try:
+                os.remove(os.path.join(shared_dir, entry))
+            except OSError:
+                pass
+    return shared_path
+
+
+def shared_version(path, cache_dir=CACHE_DIR):
+    # A stat of the pointer; cheap enough to check on every request
+    try:
+        stat = os.stat(os.path.join(_shared_dir(path, cache_dir), SHARED_POINTER))
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+@timed('shared_map')
+def map_call_log(path, columns=None, cache_dir=CACHE_DIR):
+    # Every process maps the same file, so the columns pandas can wrap
+    # zero-copy live once in the page cache however many workers there are
+    shared_dir = _shared_dir(path, cache_dir)
+    for attempt in range(MAP_ATTEMPTS):
+        version = shared_version(path, cache_dir)
+        pointer = _read_meta(os.path.join(shared_dir, SHARED_POINTER))
+        if pointer is None or pointer['sha256'] != fingerprint(path, cache_dir):
+            publish_shared(path, cache_dir)
+            version = shared_version(path, cache_dir)
+            pointer = _read_meta(os.path.join(shared_dir, SHARED_POINTER))
+        try:
+            table = pa.ipc.open_file(pa.memory_map(os.path.join(shared_dir, pointer['file']))).read_all()
+            break
+        except FileNotFoundError:
+            # Pruned by publishes that landed after the pointer was read
+            if attempt == MAP_ATTEMPTS - 1:
+                raise
+    if columns is not None:
+        table = table.select(columns)
+    return version, table.to_pandas(types_mapper=ARROW_TYPES.get, split_blocks=True)
+
+
+def iter_call_log(path, columns=None, batch_size=100_000, cache_dir=CACHE_DIR):
+    parquet_file = pq.ParquetFile(ensure_cache(path, cache_dir))
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas(types_mapper=ARROW_TYPES.get)
+
+
+if __name__ == '__main__':
+    import sys
+
+    source = sys.argv[1] if len(sys.argv) > 1 else 'anew_2 (3).csv'
+    start = time.perf_counter()
+    pd.read_csv(source)
+    untyped = time.perf_counter() - start
+
+    start = time.perf_counter()
+    build_cache(source)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    load_call_log(source)
+    warm = time.perf_counter() - start
+
+    start = time.perf_counter()
+    load_call_log(source, columns=['Created Date', 'Phone Number', 'ConversationDuration'])
+    warm_columns = time.perf_counter() - start
+
+    print(f'untyped read_csv:       {untyped:.3f}s')
+    print(f'cold (parse + cache):   {cold:.3f}s')
+    print(f'warm (full cache read): {warm:.3f}s')
+    print(f'warm (3 columns):       {warm_columns:.3f}s')
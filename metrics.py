@@ -0,0 +1,231 @@
+import pandas as pd
+
+from instrument import timed
+from loader import load_call_log
+
+CALL_LOG_PATH = 'anew_2 (3).csv'
+MONTHLY_INPUTS_PATH = 'monthly_inputs.csv'
+RATIO_TABLE_PATH = 'final_lead_data_with_ratios.csv'
+
+FUNNEL_LABELS = ["Leads", "Sales Call", "Follow Up", "Conversion", "Sale"]
+
+REACH_OUT_ALL = 'Time to reach out to the lead Whether the person had answered the call or not is irrelevant'
+REACH_OUT_CONNECTED = 'Time to reach out to the lead when conversation happen'
+
+RATIO_COLUMNS = [
+    'Lead Month', 'Lead_Count/Month', 'Phone_Call_Count/Month', 'Follow-up call/month',
+    'Validated_Lead_Count/Month', 'DM_Cost/Month', 'Phone_Cost/Month', 'Total_Cost(DM+Phone_Calls)',
+    'Count _of_Orders _Deliverd /Month', 'Revenue_generated/Month', 'Cost per lead Ratio',
+    'Cost /confirmed_order_Month_Wise_Ratio', 'Leads to Calls Connected Ratio', 'Leads to validated Lead Ratio',
+    'Leads to Order Ratio', 'Roas', 'Cost per validated lead', REACH_OUT_ALL, REACH_OUT_CONNECTED,
+]
+
+METRIC_COLUMNS = [
+    'Phone Number', 'Created Date', 'ConversationDuration', 'Price', 'Response in Sec',
+    'Delivered', 'Order id', 'Date', 'cost',
+]
+
+# Additive per-month measures; every ratio column is derived from these.
+BASE_COLUMNS = [
+    'leads', 'connected_phones', 'follow_ups', 'phone_cost', 'orders', 'revenue',
+    'reach_days_all', 'reach_count_all', 'reach_days_connected', 'reach_count_connected',
+]
+# Per-lead counts and sums, additive over any grouping of leads
+LEAD_MEASURES = [
+    'leads', 'connected_phones', 'follow_ups', 'deliveries', 'price_cents',
+    'reach_sum_all', 'reach_count_all', 'reach_sum_connected', 'reach_count_connected',
+]
+
+
+# Per (lead month, phone) partial aggregates; they merge with the same reduction
+PHONE_PARTIAL_AGGREGATES = {
+    'price_cents': 'sum',
+    'connected_calls': 'sum',
+    'first_response': 'min',
+    'first_connected_response': 'min',
+    'delivered': 'any',
+}
+
+
+def to_month(dates):
+    return dates.dt.to_period('M')
+
+
+def month_label(period):
+    # Period('2024-04') -> '24-Apr', the label used by the ratio tables
+    return period.strftime('%y-%b')
+
+
+@timed('funnel')
+def compute_funnel(data):
+    phones = data['Phone Number']
+    connected = phones[data['ConversationDuration'] > 0].value_counts()
+    total_leads_count = phones.nunique()
+    total_unique_sales_calls = len(connected)
+    total_follow_ups = int((connected > 1).sum())
+    total_conversions = phones[data['Delivered']].nunique()
+    return [total_leads_count, total_unique_sales_calls, total_follow_ups, total_conversions, total_conversions]
+
+
+def funnel_frame(funnel_vals):
+    return pd.DataFrame({"Stage": FUNNEL_LABELS, "Count": funnel_vals})
+
+
+def _cents(values):
+    # Money is summed in integer paise so partial sums merge without float drift
+    return (values.fillna(0) * 100).round().astype('int64')
+
+
+def phone_partials(data, by_day=False):
+    connected = data['ConversationDuration'] > 0
+    # Negative responses are calls logged before the lead was created
+    response = data['Response in Sec'].where(data['Response in Sec'] >= 0)
+    calls = pd.DataFrame({
+        'phone': data['Phone Number'],
+        'price_cents': _cents(data['Price']),
+        'connected_calls': connected.astype('int64'),
+        'first_response': response,
+        'first_connected_response': response.where(connected),
+        'delivered': data['Delivered'],
+    })
+    if by_day:
+        # Lead dates are whole days, so a lead-date filter is a filter on this
+        # key; the month follows from the day
+        calls.insert(0, 'day', data['Created Date'])
+        partials = merge_phone_partials(calls, keys=('day', 'phone'))
+        partials.insert(1, 'month', to_month(partials['day']))
+        return partials
+    calls.insert(0, 'month', to_month(data['Created Date']))
+    return merge_phone_partials(calls)
+
+
+def merge_phone_partials(partials, keys=('month', 'phone')):
+    return partials.groupby(list(keys), sort=False).agg(PHONE_PARTIAL_AGGREGATES).reset_index()
+
+
+def order_partials(data):
+    delivered = data.loc[data['Delivered'], ['Order id', 'Date', 'cost']].drop_duplicates('Order id')
+    # Orders are booked against the month they were placed, not the lead's month
+    return pd.DataFrame({
+        'order_id': delivered['Order id'],
+        'month': to_month(delivered['Date']),
+        'cost_cents': _cents(delivered['cost']),
+    }).reset_index(drop=True)
+
+
+def lead_measures(phones):
+    # One row per lead, i.e. per merged (month, phone) partial
+    calls = phones['connected_calls']
+    measures = pd.DataFrame({
+        'leads': 1,
+        'connected_phones': (calls > 0).astype('int64'),
+        'follow_ups': (calls > 1).astype('int64'),
+        'deliveries': phones['delivered'].astype('int64'),
+        'price_cents': phones['price_cents'],
+    }, index=phones.index)
+    for suffix, column in [('all', 'first_response'), ('connected', 'first_connected_response')]:
+        measures[f'reach_sum_{suffix}'] = phones[column].fillna(0)
+        measures[f'reach_count_{suffix}'] = phones[column].notna().astype('int64')
+    return measures[LEAD_MEASURES]
+
+
+def base_from_partials(phones, orders):
+    return base_from_measures(phones['month'], lead_measures(phones), orders)
+
+
+def base_from_measures(months, measures, orders):
+    by_month = measures.groupby(months).sum()
+    base = pd.DataFrame({
+        'leads': by_month['leads'],
+        'connected_phones': by_month['connected_phones'],
+        'follow_ups': by_month['follow_ups'],
+        'phone_cost': by_month['price_cents'] / 100,
+    })
+    for suffix in ['all', 'connected']:
+        base[f'reach_days_{suffix}'] = by_month[f'reach_sum_{suffix}'] / 86400
+        base[f'reach_count_{suffix}'] = by_month[f'reach_count_{suffix}']
+
+    by_order_month = orders.groupby('month')
+    order_counts = by_order_month.size()
+    base = base.reindex(base.index.union(order_counts.index))
+    base['orders'] = order_counts
+    base['revenue'] = by_order_month['cost_cents'].sum() / 100
+
+    base = base.fillna(0).sort_index()
+    base.index.name = 'month'
+    return base[BASE_COLUMNS]
+
+
+def funnel_from_partials(phones):
+    per_phone = phones.groupby('phone').agg(connected_calls=('connected_calls', 'sum'), delivered=('delivered', 'any'))
+    conversions = int(per_phone['delivered'].sum())
+    return [len(per_phone), int((per_phone['connected_calls'] > 0).sum()), int((per_phone['connected_calls'] > 1).sum()),
+            conversions, conversions]
+
+
+def funnel_from_measures(measures):
+    # Only when no phone is a lead twice; otherwise use funnel_from_partials
+    totals = measures[['leads', 'connected_phones', 'follow_ups', 'deliveries']].sum()
+    conversions = int(totals['deliveries'])
+    return [int(totals['leads']), int(totals['connected_phones']), int(totals['follow_ups']), conversions, conversions]
+
+
+def compute_monthly_base(data):
+    return base_from_partials(phone_partials(data), order_partials(data))
+
+
+def load_monthly_inputs(path=MONTHLY_INPUTS_PATH):
+    inputs = pd.read_csv(path)
+    inputs.columns = inputs.columns.str.strip()
+    return inputs.set_index('Lead Month')
+
+
+def _ratio(numerator, denominator):
+    return (numerator / denominator.where(denominator != 0)).fillna(0)
+
+
+def derive_ratio_table(base, inputs):
+    base = base.copy()
+    base.index = [month_label(period) for period in base.index]
+    inputs = inputs.reindex(base.index).fillna(0)
+    base.loc['Total'] = base.sum()
+    inputs.loc['Total'] = inputs.sum()
+
+    table = pd.DataFrame(index=base.index)
+    table['Lead Month'] = base.index
+    table['Lead_Count/Month'] = base['leads'].astype(int)
+    table['Phone_Call_Count/Month'] = base['connected_phones'].astype(int)
+    table['Follow-up call/month'] = base['follow_ups'].astype(int)
+    table['Validated_Lead_Count/Month'] = inputs['Validated_Lead_Count/Month'].astype(int)
+    table['DM_Cost/Month'] = inputs['DM_Cost/Month'].round(2)
+    table['Phone_Cost/Month'] = base['phone_cost'].round(2)
+    table['Total_Cost(DM+Phone_Calls)'] = (table['DM_Cost/Month'] + table['Phone_Cost/Month']).round(2)
+    table['Count _of_Orders _Deliverd /Month'] = base['orders']
+    table['Revenue_generated/Month'] = base['revenue'].round(2)
+
+    leads = table['Lead_Count/Month']
+    total_cost = table['Total_Cost(DM+Phone_Calls)']
+    orders = table['Count _of_Orders _Deliverd /Month']
+    revenue = table['Revenue_generated/Month']
+    validated = table['Validated_Lead_Count/Month']
+    table['Cost per lead Ratio'] = _ratio(total_cost, leads).round(3)
+    table['Cost /confirmed_order_Month_Wise_Ratio'] = _ratio(revenue, orders).round(3)
+    table['Leads to Calls Connected Ratio'] = _ratio(table['Phone_Call_Count/Month'], leads).round(3)
+    table['Leads to validated Lead Ratio'] = _ratio(validated, leads).round(3)
+    table['Leads to Order Ratio'] = _ratio(orders, leads).round(3)
+    table['Roas'] = _ratio(revenue, total_cost).round(3)
+    table['Cost per validated lead'] = _ratio(validated, total_cost).round(3)
+    # Mean days between lead creation and the first (connected) call
+    table[REACH_OUT_ALL] = _ratio(base['reach_days_all'], base['reach_count_all'])
+    table[REACH_OUT_CONNECTED] = _ratio(base['reach_days_connected'], base['reach_count_connected'])
+    return table[RATIO_COLUMNS].reset_index(drop=True)
+
+
+@timed('monthly')
+def compute_monthly_metrics(data, inputs):
+    return derive_ratio_table(compute_monthly_base(data), inputs)
+
+
+if __name__ == '__main__':
+    data = load_call_log(CALL_LOG_PATH, columns=METRIC_COLUMNS)
+    compute_monthly_metrics(data, load_monthly_inputs()).to_csv(RATIO_TABLE_PATH, index=False)
@@ -0,0 +1,216 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from plotly.utils import PlotlyJSONEncoder
+
+import figures
+from cohort import build_cohort_index, cohort_matrix
+from cube import DIMENSIONS, Cube
+from export import display_columns, export_workbook, lead_data_sheets
+from latency import compute_latency
+from loader import CACHE_DIR, file_hash, load_call_log
+from metrics import MONTHLY_INPUTS_PATH, compute_funnel, compute_monthly_metrics, load_monthly_inputs
+from timeseries import CallTimeSeries
+
+ARTIFACT_DIR = 'artifacts'
+# Point either app at one campaign's artifact directory to skip all parsing
+ARTIFACT_ENV = 'DASHBOARD_ARTIFACT_DIR'
+
+# Each campaign directory holds one sub-directory per generation, named for
+# the hash of its inputs, and a pointer naming the live one
+POINTER = 'current.json'
+LOAD_ATTEMPTS = 3
+MANIFEST = 'manifest.json'
+FIGURES = 'figures.json'
+RATIO_TABLE = 'ratio_table.csv'
+LEAD_DATA_CSV = 'lead_data.csv'
+LEAD_DATA_XLSX = 'lead_data.xlsx'
+COHORT = 'cohort.parquet'
+CUBE = 'cube.parquet'
+
+
+def find_campaigns(campaigns_dir, default_inputs=MONTHLY_INPUTS_PATH):
+    # One sub-directory per campaign: its call log CSV, plus its own cost
+    # inputs when it has them
+    inputs_name = os.path.basename(MONTHLY_INPUTS_PATH)
+    campaigns = []
+    for name in sorted(os.listdir(campaigns_dir)):
+        campaign_dir = os.path.join(campaigns_dir, name)
+        if not os.path.isdir(campaign_dir):
+            continue
+        logs = sorted(entry for entry in os.listdir(campaign_dir) if entry.endswith('.csv') and entry != inputs_name)
+        if len(logs) != 1:
+            raise ValueError(f'{campaign_dir} should hold exactly one call-log CSV, found {len(logs)}')
+        inputs = os.path.join(campaign_dir, inputs_name)
+        campaigns.append((name, os.path.join(campaign_dir, logs[0]), inputs if os.path.exists(inputs) else default_inputs))
+    return campaigns
+
+
+def _source(call_log, inputs_path, raw_log):
+    return {'call_log': file_hash(call_log), 'inputs': file_hash(inputs_path), 'raw_log': raw_log}
+
+
+def _source_hash(source):
+    return hashlib.sha256(json.dumps(source, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _read_json(path):
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _publish(campaign_dir, generation, source_hash):
+    # Swapping the pointer is what publishes a refresh. The generation it
+    # replaces stays until the next publish, so a dashboard that read the old
+    # pointer just before the swap can still load it
+    pointer_path = os.path.join(campaign_dir, POINTER)
+    current = _read_json(pointer_path) or {}
+    previous = current.get('previous') if current.get('generation') == generation else current.get('generation')
+    tmp_path = f'{pointer_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as pointer_file:
+        json.dump({'generation': generation, 'source': source_hash, 'previous': previous}, pointer_file)
+    os.replace(tmp_path, pointer_path)
+    for entry in os.listdir(campaign_dir):
+        if entry not in (POINTER, generation, previous) and not entry.endswith('.tmp'):
+            shutil.rmtree(os.path.join(campaign_dir, entry), ignore_errors=True)
+
+
+def campaign_figures(funnel_vals, rd_1, latency, cohort, timeseries, cube):
+    # Each panel as it first renders, before any filter or selection
+    latency_figures = figures.latency_figures(latency)
+    timeseries_figure = figures.timeseries_figure(figures.TIMESERIES_DEFAULT, *timeseries.query(figures.TIMESERIES_DEFAULT))
+    cube_figure = figures.cube_drill_figure(cube.drill(figures.CUBE_DEFAULT_BREAKDOWN), figures.CUBE_DEFAULT_BREAKDOWN, figures.CUBE_DEFAULT_MEASURE)
+    dash_figures = figures.dash_figures(funnel_vals, rd_1)
+    dash_figures.update(zip(figures.DASH_LATENCY_GRAPHS, latency_figures.values()))
+    dash_figures.update({
+        'cohort-graph': figures.cohort_heatmap_figure(cohort, figures.COHORT_DEFAULT),
+        'timeseries-graph': timeseries_figure,
+        'cube-graph': cube_figure,
+    })
+    streamlit_figures = figures.streamlit_figures(funnel_vals, rd_1)
+    streamlit_figures.update(latency_figures, timeseries=timeseries_figure)
+    return {'dash': dash_figures, 'streamlit': streamlit_figures}
+
+
+def build_campaign(name, call_log, inputs_path, artifact_root=ARTIFACT_DIR, force=False, raw_log=False):
+    start = time.perf_counter()
+    campaign_dir = os.path.join(artifact_root, name)
+    source = _source(call_log, inputs_path, raw_log)
+    source_hash = _source_hash(source)
+    current = _read_json(os.path.join(campaign_dir, POINTER))
+    if not force and current is not None and current['source'] == source_hash:
+        return name, 'unchanged', time.perf_counter() - start
+    # A forced rebuild gets a fresh name: the generation with these inputs
+    # may be the one dashboards are reading
+    generation = f'{source_hash}-{time.time_ns():x}' if force else source_hash
+    generation_dir = os.path.join(campaign_dir, generation)
+    if os.path.isdir(generation_dir):
+        # Back to the previous generation's inputs
+        _publish(campaign_dir, generation, source_hash)
+        return name, 'restored', time.perf_counter() - start
+
+    # Campaign logs often share a file name, so each gets its own Parquet cache
+    cache_dir = os.path.join(CACHE_DIR, 'campaigns', name)
+    data = load_call_log(call_log, cache_dir=cache_dir)
+    inputs = load_monthly_inputs(inputs_path)
+    funnel_vals = compute_funnel(data)
+    rd_1 = compute_monthly_metrics(data, inputs)
+    cohort = cohort_matrix(*build_cohort_index(data))
+    cube = Cube.build(data, inputs)
+    campaign = campaign_figures(funnel_vals, rd_1, compute_latency(data), cohort, CallTimeSeries(data), cube)
+
+    tmp_dir = f'{generation_dir}.{os.getpid()}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    with open(os.path.join(tmp_dir, FIGURES), 'w') as figures_file:
+        json.dump(campaign, figures_file, cls=PlotlyJSONEncoder)
+    rd_1.to_csv(os.path.join(tmp_dir, RATIO_TABLE), index=False)
+    display_columns(rd_1).to_csv(os.path.join(tmp_dir, LEAD_DATA_CSV), index=False)
+    export_workbook(lead_data_sheets(rd_1, funnel_vals, call_log if raw_log else None, cache_dir), os.path.join(tmp_dir, LEAD_DATA_XLSX))
+    cohort.to_parquet(os.path.join(tmp_dir, COHORT), index=False)
+    cube.cells.reset_index().to_parquet(os.path.join(tmp_dir, CUBE), index=False)
+    with open(os.path.join(tmp_dir, MANIFEST), 'w') as manifest_file:
+        json.dump({'campaign': name, 'call_log': call_log, 'inputs': inputs_path, 'source': source,
+                   'funnel': funnel_vals, 'built_at': pd.Timestamp.now().isoformat(timespec='seconds')}, manifest_file, indent=1)
+    os.replace(tmp_dir, generation_dir)
+    _publish(campaign_dir, generation, source_hash)
+    return name, 'built', time.perf_counter() - start
+
+
+def artifact_version(artifact_dir):
+    # A stat of the pointer; cheap enough to check on every request
+    try:
+        stat = os.stat(os.path.join(artifact_dir, POINTER))
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def load_artifacts(artifact_dir):
+    # artifact_dir is one campaign's directory; the pointer names the generation
+    for attempt in range(LOAD_ATTEMPTS):
+        pointer = _read_json(os.path.join(artifact_dir, POINTER))
+        if pointer is None:
+            raise FileNotFoundError(f'no published artifacts in {artifact_dir}')
+        try:
+            return _load_generation(os.path.join(artifact_dir, pointer['generation']))
+        except FileNotFoundError:
+            # Pruned by publishes that landed after the pointer was read
+            if attempt == LOAD_ATTEMPTS - 1:
+                raise
+
+
+def _load_generation(artifact_dir):
+    with open(os.path.join(artifact_dir, FIGURES)) as figures_file:
+        campaign = json.load(figures_file)
+    campaign.update(
+        manifest=_read_json(os.path.join(artifact_dir, MANIFEST)),
+        ratio_table=pd.read_csv(os.path.join(artifact_dir, RATIO_TABLE)),
+        lead_data=pd.read_csv(os.path.join(artifact_dir, LEAD_DATA_CSV)),
+        cohort=pd.read_parquet(os.path.join(artifact_dir, COHORT)),
+        cube=Cube(pd.read_parquet(os.path.join(artifact_dir, CUBE)).set_index(DIMENSIONS).sort_index()),
+        lead_data_csv=os.path.join(artifact_dir, LEAD_DATA_CSV),
+        lead_data_xlsx=os.path.join(artifact_dir, LEAD_DATA_XLSX),
+    )
+    return campaign
+
+
+def precompute(campaigns, artifact_root=ARTIFACT_DIR, jobs=None, force=False, raw_log=False):
+    failed = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(build_campaign, name, call_log, inputs, artifact_root, force, raw_log): name
+                   for name, call_log, inputs in campaigns}
+        for future in as_completed(futures):
+            try:
+                name, status, seconds = future.result()
+                print(f'{name}: {status} in {seconds:.1f}s')
+            except Exception as error:
+                failed.append(futures[future])
+                print(f'{futures[future]}: failed: {error!r}')
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute dashboard figures, ratio tables and exports for every campaign.')
+    parser.add_argument('campaigns_dir', help='one sub-directory per campaign with its call-log CSV and optional monthly_inputs.csv')
+    parser.add_argument('--out', default=ARTIFACT_DIR, help='artifact directory; each campaign gets a sub-directory')
+    parser.add_argument('--inputs', default=MONTHLY_INPUTS_PATH, help='cost inputs for campaigns without their own')
+    parser.add_argument('--jobs', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--force', action='store_true', help='rebuild campaigns whose inputs have not changed')
+    parser.add_argument('--raw-log', action='store_true', help='add the raw call log to the Excel export (slow for large logs)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    failed = precompute(find_campaigns(args.campaigns_dir, args.inputs), args.out, args.jobs, args.force, args.raw_log)
+    print(f'done in {time.perf_counter() - start:.1f}s')
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,191 @@
+from collections import OrderedDict
+from threading import Lock
+
+import pandas as pd
+
+from cube import phone_places
+from latency import compute_latency
+from metrics import (
+    LEAD_MEASURES, base_from_measures, base_from_partials, compute_monthly_metrics, derive_ratio_table, funnel_from_measures,
+    funnel_from_partials, lead_measures, merge_phone_partials, month_label, order_partials, phone_partials, to_month,
+)
+from timeseries import CallTimeSeries
+
+FILTER_COLUMNS = ['Location', 'Cluster name']
+ORDER_COLUMNS = ['Created Date', 'Phone Number', 'Delivered', 'Order id', 'Date', 'cost']
+# Monthly inputs that belong to all of a month's leads, not to any one slice
+SHARED_INPUTS = ['DM_Cost/Month', 'Validated_Lead_Count/Month']
+
+
+class LRUCache:
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+def _normalize_values(values):
+    if not values:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    return tuple(sorted(set(values)))
+
+
+def _normalize_date(value):
+    return None if not value else pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def normalize_filters(start_date=None, end_date=None, months=None, locations=None, clusters=None):
+    # Equivalent selections (order, duplicates, empty vs. None) share a cache key
+    return (_normalize_date(start_date), _normalize_date(end_date),
+            _normalize_values(months), _normalize_values(locations), _normalize_values(clusters))
+
+
+class CallLogQuery:
+    def __init__(self, data, inputs, maxsize=128):
+        self.data = data
+        self.inputs = inputs
+        self.cache = LRUCache(maxsize)
+        # Location and cluster are only recorded on order rows, so every row
+        # is filtered on its phone's place instead (Unassigned without an order)
+        places = phone_places(data)
+        self.row_filters = self._filters(data['Created Date'], self._places(data['Phone Number'], places))
+        # Funnel and monthly misses filter and reduce per-(lead day, phone)
+        # partials and the delivered rows, a fraction of the calls
+        self.phones = phone_partials(data, by_day=True)
+        lead_places = self._places(self.phones['phone'], places)
+        self.phone_filters = self._filters(self.phones['day'], lead_places)
+        self.orders = data.loc[data['Delivered'], ORDER_COLUMNS]
+        self.order_filters = self._filters(self.orders['Created Date'], self._places(self.orders['Phone Number'], places))
+        # With one lead per (month, phone), as in most logs, the partials'
+        # measures sum per (lead day, place) cell, and a slice's monthly base
+        # is a sum over its few cells; with one lead per phone, so is its funnel
+        self.unique_phones = self.phones['phone'].is_unique
+        self.unique_month_phones = self.unique_phones or not self.phones.duplicated(['month', 'phone']).any()
+        keys = [self.phones['day'], *(lead_places[column] for column in FILTER_COLUMNS)]
+        self.cells = lead_measures(self.phones).groupby(keys, observed=True).sum().reset_index()
+        self.cell_filters = self._filters(self.cells['day'], self.cells[FILTER_COLUMNS])
+        self.month_leads = self._month_leads(self._base(normalize_filters()))
+
+    @staticmethod
+    def _places(phones, places):
+        return pd.DataFrame({column: phones.map(places[column]).astype('category') for column in FILTER_COLUMNS})
+
+    @staticmethod
+    def _filters(dates, places):
+        # Month labels are derived once so month filters are a categorical lookup
+        months = to_month(dates).astype('category')
+        filters = {'dates': dates, 'months': months.cat.rename_categories([month_label(period) for period in months.cat.categories])}
+        filters.update(places.items())
+        return filters
+
+    @staticmethod
+    def _month_leads(base):
+        return pd.Series(base['leads'].to_numpy(), index=[month_label(period) for period in base.index])
+
+    def options(self, column):
+        if column == 'Lead Month':
+            return list(self.row_filters['months'].cat.categories)
+        return sorted(self.row_filters[column].cat.categories)
+
+    @staticmethod
+    def _mask(key, filters):
+        start_date, end_date, months, locations, clusters = key
+        mask = pd.Series(True, index=filters['dates'].index)
+        if start_date:
+            mask &= filters['dates'] >= pd.Timestamp(start_date)
+        if end_date:
+            mask &= filters['dates'] <= pd.Timestamp(end_date)
+        if months:
+            mask &= filters['months'].isin(months)
+        if locations:
+            mask &= filters['Location'].isin(locations)
+        if clusters:
+            mask &= filters['Cluster name'].isin(clusters)
+        return mask
+
+    def filtered(self, key):
+        if key == normalize_filters():
+            return self.data
+        return self.data[self._mask(key, self.row_filters)]
+
+    def _slice(self, key, frame, filters):
+        if key == normalize_filters():
+            return frame
+        return frame[self._mask(key, filters)]
+
+    def _base(self, key):
+        orders = order_partials(self._slice(key, self.orders, self.order_filters))
+        if self.unique_month_phones:
+            cells = self._slice(key, self.cells, self.cell_filters)
+            return base_from_measures(to_month(cells['day']), cells[LEAD_MEASURES], orders)
+        return base_from_partials(merge_phone_partials(self._slice(key, self.phones, self.phone_filters)), orders)
+
+    def _funnel(self, key):
+        if self.unique_phones:
+            return funnel_from_measures(self._slice(key, self.cells, self.cell_filters))
+        return funnel_from_partials(self._slice(key, self.phones, self.phone_filters))
+
+    def funnel(self, key):
+        return self.cache.get_or_compute(('funnel', key), lambda: self._funnel(key))
+
+    def slice_inputs(self, base):
+        # A slice gets its share of each month's DM cost and validated leads,
+        # by lead count, as the cube allocates DM cost
+        slice_leads = self._month_leads(base)
+        share = (slice_leads / self.month_leads.reindex(slice_leads.index).replace(0, float('nan'))).fillna(0)
+        inputs = self.inputs.reindex(slice_leads.index).fillna(0)
+        inputs[SHARED_INPUTS] = inputs[SHARED_INPUTS].mul(share, axis=0)
+        inputs['Validated_Lead_Count/Month'] = inputs['Validated_Lead_Count/Month'].round()
+        return inputs
+
+    def _monthly(self, key):
+        if key == normalize_filters():
+            return compute_monthly_metrics(self.data, self.inputs)
+        base = self._base(key)
+        return derive_ratio_table(base, self.slice_inputs(base))
+
+    def monthly(self, key):
+        return self.cache.get_or_compute(('monthly', key), lambda: self._monthly(key))
+
+    def latency(self, key):
+        return self.cache.get_or_compute(('latency', key), lambda: compute_latency(self.filtered(key)))
+
+    def timeseries(self, key):
+        return self.cache.get_or_compute(('timeseries', key), lambda: CallTimeSeries(self.filtered(key)))
@@ -0,0 +1,90 @@
+import argparse
+import gzip
+import hashlib
+
+from flask import g, request
+
+from instrument import INSTRUMENTS, PROFILING
+from loader import CACHE_DIR, publish_shared
+from metrics import CALL_LOG_PATH
+from query import LRUCache
+
+# Dash's layout and callback endpoints; everything else is static assets
+CACHED_PATHS = ('/_dash-layout', '/_dash-update-component')
+MIN_GZIP_BYTES = 1024
+
+
+class Payload:
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.gzipped = gzip.compress(body, compresslevel=6) if len(body) >= MIN_GZIP_BYTES else None
+
+
+def _respond(server, payload):
+    if payload.etag in request.if_none_match:
+        response = server.response_class(status=304)
+    elif payload.gzipped is not None and 'gzip' in request.accept_encodings:
+        response = server.response_class(payload.gzipped, mimetype=payload.mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = server.response_class(payload.body, mimetype=payload.mimetype)
+    response.set_etag(payload.etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def install_payload_cache(server, version, maxsize=512):
+    # Serialized layout and callback responses, keyed by the data version and
+    # the request body, so a repeated selection skips the callback, the JSON
+    # encoding and the compression. Callbacks must be pure functions of their
+    # inputs and the data.
+    cache = LRUCache(maxsize)
+
+    @server.before_request
+    def serve_cached_payload():
+        if request.path not in CACHED_PATHS:
+            return None
+        key = (version(), request.path, hashlib.sha1(request.get_data()).hexdigest())
+        payload = cache.get(key)
+        if payload is not None:
+            return _respond(server, payload)
+        g.payload_key = key
+        return None
+
+    @server.after_request
+    def cache_payload(response):
+        key = g.pop('payload_key', None)
+        if key is None or response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers:
+            return response
+        payload = cache.get_or_compute(key, lambda: Payload(response.get_data(), response.mimetype))
+        return _respond(server, payload)
+
+    return cache
+
+
+def install_diagnostics(server):
+    # GET /metrics for Prometheus; with DASHBOARD_PROFILING=1, POST
+    # /profile/<stage> dumps a cProfile of that stage's next run under
+    # .cache/profiles
+    @server.route('/metrics')
+    def metrics():
+        return server.response_class(INSTRUMENTS.prometheus(), mimetype='text/plain; version=0.0.4')
+
+    if not PROFILING:
+        return
+
+    @server.route('/profile/<path:name>', methods=['POST'])
+    def profile(name):
+        if not INSTRUMENTS.profile_next(name):
+            return server.response_class(f'no stage named {name} has run yet\n', status=404, mimetype='text/plain')
+        return server.response_class(f'profiling the next run of {name}\n', mimetype='text/plain')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Publish a refreshed call log to running dashboard workers.')
+    parser.add_argument('path', nargs='?', default=CALL_LOG_PATH)
+    args = parser.parse_args()
+    print(publish_shared(args.path, CACHE_DIR))
@@ -0,0 +1,82 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from loader import CACHE_DIR, fresh_cache, iter_call_log
+from metrics import CALL_LOG_PATH, FUNNEL_LABELS
+
+FUNNEL_COLUMNS = ['Phone Number', 'ConversationDuration', 'Delivered']
+
+# Parsed columns plus the temporaries a chunk goes through, per row
+BYTES_PER_ROW = 96
+MIN_CHUNK_ROWS = 10_000
+
+
+def chunk_rows_for(max_memory_mb):
+    # Half of the ceiling is left for the accumulated phone state
+    return max(MIN_CHUNK_ROWS, int(max_memory_mb * 1024 * 1024 / 2 / BYTES_PER_ROW))
+
+
+def _merge_counts(phones, counts, new_phones, new_counts):
+    merged, inverse = np.unique(np.concatenate([phones, new_phones]), return_inverse=True)
+    totals = np.bincount(inverse, weights=np.concatenate([counts, new_counts]), minlength=len(merged))
+    # Only "connected at all" and "connected more than once" matter, so saturate at 2
+    return merged, np.minimum(totals, 2).astype(np.uint8)
+
+
+class StreamingFunnel:
+    def __init__(self):
+        self.leads = np.empty(0, dtype=np.int64)
+        self.connected = np.empty(0, dtype=np.int64)
+        self.connected_counts = np.empty(0, dtype=np.uint8)
+        self.delivered = np.empty(0, dtype=np.int64)
+
+    def update(self, chunk):
+        phones = chunk['Phone Number'].to_numpy(dtype=np.int64)
+        self.leads = np.union1d(self.leads, phones)
+
+        connected, counts = np.unique(phones[(chunk['ConversationDuration'] > 0).to_numpy()], return_counts=True)
+        self.connected, self.connected_counts = _merge_counts(self.connected, self.connected_counts, connected, counts)
+
+        delivered = chunk['Delivered']
+        if delivered.dtype != bool:
+            delivered = delivered.eq('Y').fillna(False)
+        self.delivered = np.union1d(self.delivered, phones[delivered.to_numpy(dtype=bool)])
+        return self
+
+    def state_bytes(self):
+        return self.leads.nbytes + self.connected.nbytes + self.connected_counts.nbytes + self.delivered.nbytes
+
+    def result(self):
+        conversions = len(self.delivered)
+        return [len(self.leads), len(self.connected), int((self.connected_counts > 1).sum()), conversions, conversions]
+
+
+def iter_csv_chunks(path, chunk_rows):
+    return pd.read_csv(path, usecols=FUNNEL_COLUMNS, dtype={'Phone Number': 'int64', 'Delivered': 'string'}, chunksize=chunk_rows)
+
+
+def streaming_funnel(path=CALL_LOG_PATH, max_memory_mb=256, source='cache', chunk_rows=None, cache_dir=CACHE_DIR):
+    chunk_rows = chunk_rows or chunk_rows_for(max_memory_mb)
+    # Building the Parquet cache parses the whole CSV in memory, so a cold or
+    # stale cache is skipped in favour of CSV chunks rather than rebuilt
+    if source == 'cache' and fresh_cache(path, cache_dir):
+        chunks = iter_call_log(path, columns=FUNNEL_COLUMNS, batch_size=chunk_rows, cache_dir=cache_dir)
+    else:
+        chunks = iter_csv_chunks(path, chunk_rows)
+    funnel = StreamingFunnel()
+    for chunk in chunks:
+        if funnel.update(chunk).state_bytes() > max_memory_mb * 1024 * 1024 / 2:
+            raise MemoryError(f'phone state outgrew the {max_memory_mb} MB ceiling')
+    return funnel.result()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute the sales funnel in bounded memory.')
+    parser.add_argument('path', nargs='?', default=CALL_LOG_PATH)
+    parser.add_argument('--max-memory-mb', type=int, default=256)
+    parser.add_argument('--source', choices=['cache', 'csv'], default='cache',
+                        help='cache reads the Parquet cache when it is fresh and falls back to the CSV otherwise')
+    args = parser.parse_args()
+    print(dict(zip(FUNNEL_LABELS, streaming_funnel(args.path, args.max_memory_mb, args.source))))
@@ -0,0 +1,105 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import EXACT, HLL, IngestState
+from loader import read_call_log_csv
+from metrics import CALL_LOG_PATH, compute_funnel, compute_monthly_base
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_batches(directory, count):
+    with open(os.path.join(REPO_DIR, CALL_LOG_PATH)) as source:
+        header, *lines = source.readlines()
+    size = -(-len(lines) // count)
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, f'batch_{index}.csv')
+        with open(path, 'w') as batch:
+            batch.writelines([header, *lines[index * size:(index + 1) * size]])
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture(scope='module')
+def full():
+    data = read_call_log_csv(os.path.join(REPO_DIR, CALL_LOG_PATH))
+    return compute_monthly_base(data), compute_funnel(data)
+
+
+def assert_matches(state, full):
+    base, funnel_vals = full
+    pd.testing.assert_frame_equal(state.monthly_base(), base, check_dtype=False)
+    assert state.funnel() == funnel_vals
+
+
+def test_batches_match_full_recompute(tmp_path, full):
+    state = IngestState(str(tmp_path / 'state'))
+    for path in write_batches(str(tmp_path), 4):
+        assert state.ingest(path)
+    assert_matches(state, full)
+    # A reopened state reads the same partitions
+    assert_matches(IngestState(str(tmp_path / 'state')), full)
+
+
+def test_reingest_is_skipped_whatever_the_file_name(tmp_path, full):
+    first, second = write_batches(str(tmp_path), 2)
+    renamed = []
+    for directory, path in [('a', first), ('b', second)]:
+        os.makedirs(tmp_path / directory)
+        renamed.append(os.path.join(str(tmp_path), directory, 'calls.csv'))
+        os.replace(path, renamed[-1])
+    state = IngestState(str(tmp_path / 'state'))
+    assert state.ingest(renamed[0]) and state.ingest(renamed[1])
+    assert not state.ingest(renamed[0])
+    assert_matches(state, full)
+
+
+def test_batch_interrupted_before_manifest_is_retried_cleanly(tmp_path, full, monkeypatch):
+    first, second = write_batches(str(tmp_path), 2)
+    state = IngestState(str(tmp_path / 'state'))
+    state.ingest(first)
+
+    def crash():
+        raise OSError('killed')
+    monkeypatch.setattr(state, '_save_manifest', crash)
+    with pytest.raises(OSError):
+        state.ingest(second)
+
+    # The partitions written before the crash were never published
+    restarted = IngestState(str(tmp_path / 'state'))
+    assert restarted.ingest(first) is False
+    assert restarted.ingest(second)
+    assert_matches(restarted, full)
+
+
+def test_batches_append_parts_without_rewriting_earlier_ones(tmp_path, full):
+    state = IngestState(str(tmp_path / 'state'))
+    paths = write_batches(str(tmp_path), 3)
+    state.ingest(paths[0])
+    written = {name: os.stat(tmp_path / 'state' / 'phones' / name).st_mtime_ns for name in os.listdir(tmp_path / 'state' / 'phones')}
+    for path in paths[1:]:
+        state.ingest(path)
+    for name, mtime_ns in written.items():
+        assert os.stat(tmp_path / 'state' / 'phones' / name).st_mtime_ns == mtime_ns
+    assert len(state.manifest['parts']) == 3
+
+
+@pytest.mark.parametrize('mode', [EXACT, HLL])
+def test_compaction_keeps_results(tmp_path, full, mode):
+    state = IngestState(str(tmp_path / 'state'), mode)
+    for path in write_batches(str(tmp_path), 4):
+        state.ingest(path)
+    before = state.monthly_base(), state.funnel()
+    assert state.compact()
+    assert len(os.listdir(tmp_path / 'state' / 'phones')) == 1
+    compacted = IngestState(str(tmp_path / 'state'), mode)
+    pd.testing.assert_frame_equal(compacted.monthly_base(), before[0])
+    assert compacted.funnel() == before[1]
+    if mode == EXACT:
+        assert_matches(compacted, full)
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from latency import PERCENTILES, TDigest
+
+QUANTILES = np.array(PERCENTILES) / 100
+
+
+@pytest.fixture(scope='module')
+def values():
+    return np.random.default_rng(0).lognormal(8, 1.5, 200_000)
+
+
+def relative_errors(digest, values):
+    return np.abs(digest.quantile(QUANTILES) / np.quantile(values, QUANTILES) - 1)
+
+
+def test_merged_digests_stay_accurate(values):
+    merged = TDigest()
+    for part in np.array_split(values, 50):
+        merged = merged.merge(TDigest().add(part))
+    assert merged.count == len(values)
+    assert relative_errors(merged, values).max() < 0.005
+
+
+def test_incremental_adds_stay_accurate(values):
+    digest = TDigest()
+    for part in np.array_split(values, 100):
+        digest.add(part)
+    assert digest.count == len(values)
+    assert relative_errors(digest, values).max() < 0.005
+
+
+def test_centroids_stay_bounded(values):
+    digest = TDigest().add(values)
+    for _ in range(20):
+        digest = digest.merge(TDigest().add(values[:1000]))
+    assert len(digest.means) <= digest.compression
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loader import read_call_log_csv
+from metrics import CALL_LOG_PATH, compute_funnel, compute_monthly_base, derive_ratio_table, load_monthly_inputs
+from query import CallLogQuery, normalize_filters
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def data():
+    return read_call_log_csv(os.path.join(REPO_DIR, CALL_LOG_PATH))
+
+
+def _single_lead_phones(data):
+    lead_dates = data.groupby('Phone Number')['Created Date'].nunique()
+    return data[data['Phone Number'].isin(lead_dates.index[lead_dates == 1])]
+
+
+def _keys(query):
+    locations, clusters, months = query.options('Location'), query.options('Cluster name'), query.options('Lead Month')
+    return [
+        normalize_filters(),
+        normalize_filters(locations=locations[:1]),
+        normalize_filters(clusters=clusters[-1:]),
+        normalize_filters(months=months[:2]),
+        normalize_filters(query.row_filters['dates'].quantile(0.3), None, months, locations[:3], clusters),
+    ]
+
+
+@pytest.mark.parametrize('single_lead', [False, True])
+def test_partial_paths_match_filtered_rows(data, single_lead):
+    if single_lead:
+        data = _single_lead_phones(data)
+    query = CallLogQuery(data, load_monthly_inputs(os.path.join(REPO_DIR, 'monthly_inputs.csv')))
+    assert query.unique_phones == single_lead
+    for key in _keys(query):
+        rows = query.filtered(key)
+        assert query.funnel(key) == compute_funnel(rows)
+        base = compute_monthly_base(rows)
+        pd.testing.assert_frame_equal(query.monthly(key), derive_ratio_table(base, query.slice_inputs(base)))
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loader import _cache_paths, ensure_cache, read_call_log_csv
+from metrics import CALL_LOG_PATH, compute_funnel
+from streaming import streaming_funnel
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATH = os.path.join(REPO_DIR, CALL_LOG_PATH)
+
+
+@pytest.fixture(scope='module')
+def funnel_vals():
+    return compute_funnel(read_call_log_csv(PATH))
+
+
+@pytest.mark.parametrize('chunk_rows', [97, 1000, 100_000])
+def test_csv_chunks_match_full_funnel(tmp_path, funnel_vals, chunk_rows):
+    assert streaming_funnel(PATH, source='csv', chunk_rows=chunk_rows, cache_dir=str(tmp_path)) == funnel_vals
+
+
+@pytest.mark.parametrize('chunk_rows', [97, 1000, 100_000])
+def test_cache_batches_match_full_funnel(tmp_path, funnel_vals, chunk_rows):
+    ensure_cache(PATH, str(tmp_path))
+    assert streaming_funnel(PATH, source='cache', chunk_rows=chunk_rows, cache_dir=str(tmp_path)) == funnel_vals
+
+
+def test_cold_cache_streams_the_csv_without_building(tmp_path, funnel_vals):
+    assert streaming_funnel(PATH, source='cache', chunk_rows=500, cache_dir=str(tmp_path)) == funnel_vals
+    assert not os.path.exists(_cache_paths(PATH, str(tmp_path))[0])
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+from instrument import timed
+
+TIMESERIES_COLUMNS = ['Start Date (Formatted)', 'Start Time', 'ConversationDuration', 'Price']
+SERIES = {
+    'calls': 'Calls',
+    'connected_calls': 'Connected calls',
+    'conversation_minutes': 'Conversation minutes',
+    'phone_cost': 'Phone cost',
+}
+GRANULARITIES = ['call', 'hour', 'day']
+RESAMPLE_RULES = {'hour': 'h', 'day': 'D'}
+
+# Roughly two points per horizontal pixel of a full-width chart
+MAX_POINTS = 2000
+
+
+def call_timestamps(data):
+    start = data['Start Time']
+    seconds = (start.str.slice(0, 2).astype('float64') * 3600 + start.str.slice(3, 5).astype('float64') * 60
+               + start.str.slice(6, 8).astype('float64'))
+    return data['Start Date (Formatted)'] + pd.to_timedelta(seconds.to_numpy(dtype='float64', na_value=np.nan), unit='s')
+
+
+def call_frame(data):
+    conversation = data['ConversationDuration'].fillna(0).to_numpy()
+    calls = pd.DataFrame({
+        'calls': 1,
+        'connected_calls': (conversation > 0).astype('int64'),
+        'conversation_minutes': conversation / 60,
+        'phone_cost': data['Price'].fillna(0).to_numpy(),
+    }, index=pd.DatetimeIndex(call_timestamps(data), name='time'))
+    # Leads that were never called have no start time
+    return calls[calls.index.notna()].sort_index()
+
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: keep the first and last point and, per
+    # bucket, the point spanning the largest triangle with its neighbours
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area)) if hi > lo else a
+        selected[i + 1] = a
+    return np.unique(selected)
+
+
+def minmax(y, n_out):
+    # The extremes of each equal-count bucket, so spikes always survive
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    buckets = pd.Series(y).groupby(np.arange(n) * max(n_out // 2, 1) // n)
+    return np.union1d(np.union1d(buckets.idxmin(), buckets.idxmax()), [0, n - 1])
+
+
+DOWNSAMPLERS = {
+    'lttb': lttb,
+    'minmax': lambda x, y, n_out: minmax(y, n_out),
+}
+
+
+# The call log at call, hour and day resolution. Every query slices one
+# level by time and downsamples it, so the points returned are bounded by
+# max_points however long the log is.
+class CallTimeSeries:
+    @timed('timeseries')
+    def __init__(self, data):
+        calls = call_frame(data)
+        self.levels = {'call': calls}
+        for granularity, rule in RESAMPLE_RULES.items():
+            self.levels[granularity] = calls.resample(rule).sum()
+
+    def bounds(self):
+        index = self.levels['call'].index
+        return (index[0], index[-1]) if len(index) else (None, None)
+
+    def _window(self, granularity, start, end):
+        return self.levels[granularity].loc[start:end]
+
+    def granularity_for(self, start=None, end=None, max_points=MAX_POINTS):
+        # The finest level that fits in view without downsampling, so zooming in
+        # moves from days to hours to single calls
+        for granularity in GRANULARITIES[:-1]:
+            index = self.levels[granularity].index
+            count = index.searchsorted(end, side='right') if end is not None else len(index)
+            count -= index.searchsorted(start) if start is not None else 0
+            if count <= max_points:
+                return granularity
+        return GRANULARITIES[-1]
+
+    def query(self, series, start=None, end=None, granularity='auto', max_points=MAX_POINTS, method='lttb'):
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+        if granularity == 'auto':
+            granularity = self.granularity_for(start, end, max_points)
+        values = self._window(granularity, start, end)[series]
+        x = values.index.asi8.astype('float64')
+        kept = DOWNSAMPLERS[method](x, values.to_numpy(dtype='float64'), max_points)
+        return values.iloc[kept], granularity, len(values)